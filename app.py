@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import glob
+import threading
 import shlex
 import difflib
 from markupsafe import Markup, escape
@@ -30,9 +31,19 @@ from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 from flask import flash, abort  
 from autograde_lib import run_autograde, ASSIGNMENTS
-from models_homework import HomeworkSubmission
-from docker_grader import run_pytest_in_docker,run_python_in_docker
+from models_homework import HomeworkSubmission, ensure_homework_columns
+from sqlalchemy.orm import defer
+from docker_grader import run_pytest_in_docker,run_python_in_docker, is_infra_failure, run_pytest_batch_in_docker
+from docker_grader import stream_python_in_docker
+import grader_jobs
+from grader_jobs import GRADER_ASYNC, GraderInfraError
+from grader_scheduler import scheduler, SchedulerBusy, PRIORITY_SUBMIT, PRIORITY_CHECK, PRIORITY_RUN, PRIORITY_REGRADE
+import grader_metrics
+import grader_regrade
+from grader_regrade import GRADER_REGRADE_USE_BATCH
+import grader_cache
 from homework_defs import HOMEWORKS
+import homework_assets
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -90,7 +101,9 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_timeout": 10,     # fail fast instead of hanging forever
 }
 
-socketio.init_app(app, cors_allowed_origins="*", async_mode="eventlet")
+# Needed when grader workers push results from another process (GRADER_ASYNC=1)
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None
+socketio.init_app(app, cors_allowed_origins="*", async_mode="eventlet", message_queue=SOCKETIO_MESSAGE_QUEUE)
 db.init_app(app)
 
 from lecture import lecture_bp
@@ -129,6 +142,7 @@ def _aware_local(dt):
 with app.app_context():
     try:
         db.create_all()
+        ensure_homework_columns()
     except Exception as e:
         app.logger.warning(f"db.create_all() skipped/failed: {e}")
 
@@ -385,11 +399,32 @@ def _score_from_pytest_result(result: dict):
         return None
     return 100.0 * (passed / denom)
 
+def _compact_report_json(result: dict):
+    report = result.get("report")
+    return json.dumps(report, separators=(",", ":")) if report else None
+
+
+def _result_json_for_storage(result: dict, **extra) -> str:
+    # the per-test report lives in report_json; don't store it twice
+    return json.dumps({**{k: v for k, v in result.items() if k != "report"}, **extra})
+
+
+def _report_from_submission(sub: HomeworkSubmission):
+    try:
+        return json.loads(sub.report_json) if sub.report_json else None
+    except Exception:
+        return None
+
+
 def _passed_failed_from_submission(sub: HomeworkSubmission):
     """
-    Return (passed, failed) from stored result_json.
-    Handles missing/old rows safely.
+    Return (passed, failed) from the stored report (or result_json for
+    rows graded before reports existed).  Handles missing/old rows safely.
     """
+    report = _report_from_submission(sub)
+    if report is not None:
+        outcomes = [t.get("outcome") for t in report.get("tests", [])]
+        return outcomes.count("passed"), outcomes.count("failed")
     try:
         j = json.loads(sub.result_json or "{}")
         passed = int(j.get("passed") or 0)
@@ -1173,20 +1208,53 @@ def api_course_check(course, lesson):
     if not step:
         return jsonify({"error":"bad_step"}), 400
 
+    payload = {
+        "course": course,
+        "lesson": lesson,
+        "netid": session["netid"],
+        "step_id": step_id,
+        "code": code,
+    }
+    if GRADER_ASYNC and step.get("test_glob"):
+        job_id = grader_jobs.enqueue("course_check", payload, netid=session["netid"])
+        return jsonify({"job_id": job_id, "status_url": url_for("api_grader_job", job_id=job_id)}), 202
+
+    body, status = _grade_course_step(payload)
+    return jsonify(body), status
+
+
+def _grade_course_step(payload: dict, *, strict_infra: bool = False):
+    """
+    Run one lesson step's tests and record progress.  Shared by the inline
+    check endpoint and the grading worker (strict_infra=True, which raises
+    GraderInfraError instead of recording a sandbox failure).
+    """
+    course, lesson = payload["course"], payload["lesson"]
+    netid, step_id, code = payload["netid"], int(payload["step_id"]), payload.get("code") or ""
+
+    root = (BASE_DIR / "courses" / course / lesson).resolve()
+    meta = json.loads((root / "lesson.json").read_text(encoding="utf-8"))
+    step = next((s for s in meta["steps"] if int(s["id"]) == step_id), None)
+    if not step:
+        return {"error": "bad_step"}, 400
+
     # build docker file map
     files = {"student.py": code}
     test_glob = step.get("test_glob")
     if test_glob:
         for p in sorted(glob.glob(str(root / test_glob))):
             files[Path(p).name] = Path(p).read_text(encoding="utf-8")
-        res = run_pytest_in_docker(files, timeout_s=10)
+        res = run_pytest_in_docker(files, timeout_s=10, netid=netid, priority=PRIORITY_CHECK,
+                                   endpoint="course_check", assignment=f"{course}/{lesson}")
+        if strict_infra and is_infra_failure(res):
+            raise GraderInfraError(res.get("output") or f"exit {res.get('exit_code')}")
         passed = (res["failed"] == 0)
     else:
         # info-only step: "checking" just marks complete
         res = {"passed": 1, "failed": 0, "output": "Marked complete."}
         passed = True
 
-    st = TutorialState.query.filter_by(netid=session["netid"], course=course, lesson=lesson).first()
+    st = TutorialState.query.filter_by(netid=netid, course=course, lesson=lesson).first()
     progress = json.loads(st.progress_json or "{}")
     progress[str(step_id)] = passed 
     st.code = code
@@ -1194,7 +1262,7 @@ def api_course_check(course, lesson):
     st.updated_at = datetime.utcnow()
     db.session.commit()
 
-    return jsonify(res | {"progress": progress})
+    return res | {"progress": progress}, 200
 
 
 @app.post("/api/course/<course>/<lesson>/progress")
@@ -1219,6 +1287,43 @@ def api_course_progress(course, lesson):
     return jsonify({"progress": progress})
 
 
+_RUN_ID_RE = re.compile(r"^[0-9a-f]{8,32}$")
+
+
+def _start_streamed_run(data: dict, code: str, args: list, *, netid: str, endpoint: str, assignment: str):
+    """
+    Opt-in live output for Run buttons (request body has "stream": true).
+    Output is pushed to the user's socket room as `run_output`
+    {run_id, stream, data, seq} frames, followed by one `run_done` frame with
+    exit_code / timed_out / truncated / bytes / wall_s.  The client picks the
+    run_id so it can listen before the POST returns.
+    """
+    run_id = str(data.get("run_id") or "")
+    if not _RUN_ID_RE.match(run_id):
+        run_id = uuid4().hex
+    room = f"user:{netid}"
+    seq = [0]
+
+    def on_output(stream, text):
+        seq[0] += 1
+        socketio.emit("run_output", {"run_id": run_id, "stream": stream, "data": text, "seq": seq[0]}, to=room)
+
+    def target():
+        try:
+            res = stream_python_in_docker(code, timeout_s=3, args=args, on_output=on_output,
+                                          netid=netid, priority=PRIORITY_RUN,
+                                          endpoint=endpoint, assignment=assignment)
+        except SchedulerBusy as e:
+            res = {"error": e.reason, "retry_after": e.retry_after}
+        except Exception as e:
+            app.logger.exception("streamed run failed")
+            res = {"error": "server_error", "detail": str(e)}
+        socketio.emit("run_done", {"run_id": run_id, **res}, to=room)
+
+    threading.Thread(target=target, name="run-stream", daemon=True).start()
+    return jsonify({"run_id": run_id, "stream": True, "cmd_display": "$ python main.py " + " ".join(args)}), 202
+
+
 @app.post("/api/course/<course>/<lesson>/run")
 def api_course_run(course, lesson):
     if not session.get("netid"):
@@ -1228,10 +1333,20 @@ def api_course_run(course, lesson):
     code = data.get("code") or ""
     args = data.get("args") or ""
 
+    if data.get("stream"):
+        _save_tutorial_draft(course, lesson, code)
+        return _start_streamed_run(data, code, shlex.split(args)[:20], netid=session["netid"],
+                                   endpoint="course_run", assignment=f"{course}/{lesson}")
+
     # reuse your docker python runner (it already works)
     try:
 
-        res = run_python_in_docker(code, timeout_s=3, args=shlex.split(args)[:20])
+        res = run_python_in_docker(code, timeout_s=3, args=shlex.split(args)[:20],
+                                   netid=session["netid"], priority=PRIORITY_RUN,
+                                   endpoint="course_run", assignment=f"{course}/{lesson}")
+
+    except SchedulerBusy:
+        raise
 
     except Exception as e:
 
@@ -1251,15 +1366,17 @@ def api_course_run(course, lesson):
 
         }
 
-    # save code draft
+    _save_tutorial_draft(course, lesson, code)
+    return jsonify(res)
+
+
+def _save_tutorial_draft(course, lesson, code):
     st = TutorialState.query.filter_by(netid=session["netid"], course=course, lesson=lesson).first()
     if st:
         st.code = code
         st.updated_at = datetime.now(timezone.utc)
         db.session.commit()
 
-    return jsonify(res)
-
 def list_lessons(course: str):
     course_dir = (BASE_DIR / "courses" / course).resolve()
     lessons = []
@@ -1430,6 +1547,7 @@ def hw_index():
 
     for slug, hw in HOMEWORKS.items():
         latest = (HomeworkSubmission.query
+                  .options(defer(HomeworkSubmission.code), defer(HomeworkSubmission.result_json))
                   .filter_by(slug=slug, netid=netid)
                   .order_by(HomeworkSubmission.created_at.desc())
                   .first())
@@ -1468,6 +1586,7 @@ def hw_index():
                 "late_days": latest.late_days,
                 "penalty_frac": latest.penalty_frac,
                 "reopen_penalty_frac": getattr(latest, "reopen_penalty_frac", 0.0),
+                "questions": (_report_from_submission(latest) or {}).get("questions") or {},
             }
  
 
@@ -1490,24 +1609,8 @@ def hw_index():
         avg_score=avg_score,
     )
 
-def _load_homework_starter_workspace(root: Path) -> dict[str, str]:
-    starter_dir = root / "starter_files"
-    if starter_dir.exists() and starter_dir.is_dir():
-        out = {}
-        for p in sorted(starter_dir.rglob("*")):
-            if p.is_file():
-                rel = p.relative_to(starter_dir).as_posix()
-                out[rel] = p.read_text(encoding="utf-8")
-        if out:
-            return out
-
-    starter_path = root / "starter.py"
-    starter = starter_path.read_text(encoding="utf-8") if starter_path.exists() else ""
-    return {"student.py": starter}
-
-
-def _workspace_from_submission(sub, root: Path) -> dict[str, str]:
-    starter = _load_homework_starter_workspace(root)
+def _workspace_from_submission(sub, slug: str) -> dict[str, str]:
+    starter = homework_assets.get(slug).starter_workspace()
     if not sub:
         return starter
 
@@ -1546,11 +1649,9 @@ def hw_page(slug):
         .order_by(HomeworkSubmission.created_at.desc())
         .first())
 
-    root = (BASE_DIR / hw["root"]).resolve()
-    prompt_path  = root / "prompt.md"
-    prompt_md = prompt_path.read_text(encoding="utf-8") if prompt_path.exists() else ""
+    prompt_md = homework_assets.get(slug).prompt_md
 
-    initial_files = _workspace_from_submission(latest_any, root)
+    initial_files = _workspace_from_submission(latest_any, slug)
     initial_code = initial_files.get("student.py", "")
 
     # LOCK only if there is a final
@@ -1668,46 +1769,18 @@ def hw_run(slug):
         return jsonify({"error": "too_large"}), 400
 
     args = shlex.split(args_str)[:20]   # cap number of args
-    res = run_python_in_docker(code, timeout_s=3, args=args)
+    if data.get("stream"):
+        return _start_streamed_run(data, code, args, netid=session["netid"], endpoint="hw_run", assignment=slug)
+    res = run_python_in_docker(code, timeout_s=3, args=args, netid=session["netid"], priority=PRIORITY_RUN,
+                               endpoint="hw_run", assignment=slug)
     return jsonify(res)
 
 @app.post("/api/hw/<slug>/submit")
 def hw_submit(slug):
-    def load_test_files(root: Path, include_hidden: bool) -> dict:
-        files = {}
-        for p in sorted((root / "tests_public").glob("*.py")):
-            files[p.name] = p.read_text(encoding="utf-8")
-        if include_hidden and (root / "tests_hidden").exists():
-            for p in sorted((root / "tests_hidden").glob("*.py")):
-                files[p.name] = p.read_text(encoding="utf-8")
-        return files
-    
-    def load_tests(root: Path, include_hidden: bool, qid: int | None):
-        files = {}
-
-        pub = root / "tests_public"
-        if qid is None:
-            paths = sorted(pub.glob("*.py"))
-        else:
-            paths = sorted(pub.glob(f"test_q{qid}_*.py")) or sorted(pub.glob(f"test_q{qid}.py"))
-            if not paths:
-                raise FileNotFoundError(f"no public test for qid={qid}")
-
-        for p in paths:
-            files[p.name] = p.read_text(encoding="utf-8")
-
-        if include_hidden and (root / "tests_hidden").exists():
-            for p in sorted((root / "tests_hidden").glob("*.py")):
-                files[p.name] = p.read_text(encoding="utf-8")
-
-        return files
-
     if not session.get("netid"):
         return jsonify({"error": "not_logged_in"}), 401
     if slug not in HOMEWORKS:
         return jsonify({"error": "unknown_homework"}), 404
-    hw = HOMEWORKS[slug]
-
 
     data = request.get_json(force=True) or {}
     action = (data.get("action") or "check").lower()
@@ -1721,14 +1794,10 @@ def hw_submit(slug):
     if "student.py" not in workspace:
         workspace["student.py"] = str(data.get("code") or "")
 
-    code = workspace.get("student.py", "")
     if action not in ("check", "submit"):
         action = "check"
 
     netid = session["netid"]
-    # defaults so "check" doesn't crash
-    reopen_penalty_frac = 0.0
-    score_final_after_reopen = None
 
     # enforce one submit
     if action == "submit":
@@ -1743,57 +1812,67 @@ def hw_submit(slug):
                 "submitted_at": existing.created_at.isoformat(),
             }), 409
 
-    #hw = HOMEWORKS[slug]
-    #root = Path(HOMEWORKS[slug]["root"])
-    #include_hidden = (action == "submit")
-    #tests = load_test_files(root, include_hidden)
-    #files = {"student.py": code, **tests}
-    #result = run_pytest_in_docker(files, timeout_s=10)
-
     qid = data.get("qid")
     qid = int(qid) if (action == "check" and qid is not None) else None
 
-    root = (BASE_DIR / HOMEWORKS[slug]["root"]).resolve()
+    payload = {
+        "slug": slug,
+        "netid": netid,
+        "section": session.get("section"),
+        "action": action,
+        "qid": qid,
+        "workspace": workspace,
+        "bypass_cache": bool(session.get("is_admin") and data.get("bypass_cache")),
+        # late penalties are based on when the student pressed submit,
+        # not on when a worker gets around to grading it
+        "submitted_at": datetime.now(TZ).isoformat(),
+    }
+    if GRADER_ASYNC:
+        job_id = grader_jobs.enqueue("hw_submit", payload, netid=netid)
+        return jsonify({"job_id": job_id, "status_url": url_for("api_grader_job", job_id=job_id)}), 202
+
+    body, status = _grade_homework(payload)
+    return jsonify(body), status
+
+
+def _grade_homework(payload: dict, *, strict_infra: bool = False):
+    """
+    Grade a homework check/submit and, for a final submit, write the
+    HomeworkSubmission row.  Shared by hw_submit and the grading worker
+    (strict_infra=True, which raises GraderInfraError rather than storing a
+    sandbox failure as the student's grade).
+    """
+    slug = payload["slug"]
+    hw = HOMEWORKS[slug]
+    netid = payload["netid"]
+    action = payload["action"]
+    qid = payload.get("qid")
+    workspace = payload["workspace"]
+    code = workspace.get("student.py", "")
+
+    # defaults so "check" doesn't crash
+    reopen_penalty_frac = 0.0
+    score_final_after_reopen = None
+
     include_hidden = (action == "submit")
 
     try:
-        tests = load_tests(root, include_hidden, qid)
+        tests = homework_assets.get(slug).tests(include_hidden, qid)
     except FileNotFoundError as e:
-        return jsonify({"error": "bad_qid", "detail": str(e)}), 400
-
-    files = {**workspace, **tests}
-    result = run_pytest_in_docker(files, timeout_s=10)
+        return {"error": "bad_qid", "detail": str(e)}, 400
+
+    priority = PRIORITY_SUBMIT if action == "submit" else PRIORITY_CHECK
+    result = run_pytest_in_docker(workspace, tests=tests, timeout_s=10, netid=netid, priority=priority,
+                                  endpoint=f"hw_{action}", assignment=slug,
+                                  use_cache=not payload.get("bypass_cache"))
+    if strict_infra and is_infra_failure(result):
+        raise GraderInfraError(result.get("output") or f"exit {result.get('exit_code')}")
     result["cmd_display"] = "$ pytest -q"
 
-
-    #submitted_at = None
-    #submission_id = None
-
-    #if action == "submit":
-    #    sub = HomeworkSubmission(
-    #        slug=slug,
-    #        netid=netid,
-    #        section=session.get("section"),
-    #        code=code,
-    #        result_json=json.dumps(result),
-    #    )
-    #    db.session.add(sub)
-    #    db.session.commit()
-    #    submitted_at = sub.created_at.isoformat()
-    #    submission_id = sub.id
-
-    #return jsonify({
-    #    "title": hw["title"],
-    #    "passed": result["passed"],
-    #    "failed": result["failed"],
-    #    "output": result["output"],
-    #    "submission_id": submission_id,
-    #    "submitted_at": submitted_at,
-    #})
     submitted_at = None
     submission_id = None
 
-    submitted_dt = datetime.now(TZ)
+    submitted_dt = datetime.fromisoformat(payload["submitted_at"])
     due_dt = _parse_due_at(hw)  # hw = HOMEWORKS[slug]
     late_seconds, late_days = _late_info(due_dt, submitted_dt)
 
@@ -1804,6 +1883,17 @@ def hw_submit(slug):
         score_final = max(0.0, score_raw * (1.0 - penalty_frac))
 
     if action == "submit":
+        # a queued submit can race a second one from another tab
+        existing = (HomeworkSubmission.query
+            .filter_by(slug=slug, netid=netid, is_final=1)
+            .order_by(HomeworkSubmission.created_at.desc())
+            .first())
+        if existing:
+            return {
+                "error": "already_submitted",
+                "submitted_at": existing.created_at.isoformat(),
+            }, 409
+
         reopen_base = (HomeworkSubmission.query
             .filter_by(slug=slug, netid=netid)
             .filter(HomeworkSubmission.reopened_at.isnot(None))
@@ -1818,9 +1908,10 @@ def hw_submit(slug):
         sub = HomeworkSubmission(
             slug=slug,
             netid=netid,
-            section=session.get("section"),
+            section=payload.get("section"),
             code=code,
-            result_json=json.dumps({**result, "_workspace": workspace}),
+            result_json=_result_json_for_storage(result, _workspace=workspace),
+            report_json=_compact_report_json(result),
 
             is_final=1,
             due_at=(due_dt.isoformat() if due_dt else None),
@@ -1840,11 +1931,12 @@ def hw_submit(slug):
         submitted_at = sub.submitted_at
         submission_id = sub.id
 
-    return jsonify({
+    return {
         "title": hw["title"],
         "passed": result["passed"],
         "failed": result["failed"],
         "output": result["output"],
+        "report": result.get("report"),
         "submission_id": submission_id,
         "submitted_at": submitted_at,
 
@@ -1858,8 +1950,46 @@ def hw_submit(slug):
         "score_final_after_reopen": score_final_after_reopen,
         "score_effective": (score_final_after_reopen if score_final_after_reopen is not None else score_final),
 
+    }, 200
+
+
+grader_jobs.register("hw_submit", lambda payload: _grade_homework(payload, strict_infra=True))
+grader_jobs.register("course_check", lambda payload: _grade_course_step(payload, strict_infra=True))
+
+
+@app.get("/api/grader/jobs/<job_id>")
+def api_grader_job(job_id):
+    if not session.get("netid"):
+        return jsonify({"error": "not_logged_in"}), 401
+    job = grader_jobs.get_job(job_id)
+    if not job or (job["netid"] != session["netid"] and not session.get("is_admin")):
+        return jsonify({"error": "unknown_job"}), 404
+    return jsonify(grader_jobs.job_status_payload(job))
+
+
+@app.errorhandler(SchedulerBusy)
+def _sandbox_busy(e):
+    resp = jsonify({"error": e.reason, "retry_after": e.retry_after})
+    resp.status_code = e.status
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@app.get("/api/admin/grader/stats")
+def api_admin_grader_stats():
+    if not (session.get("netid") and session.get("is_admin")):
+        return jsonify({"error": "not_admin"}), 403
+    from docker_grader import get_pool
+    pool = get_pool()
+    return jsonify({
+        "scheduler": scheduler.stats(),
+        "pool": pool.stats() if pool else None,
+        "cache": grader_cache.stats(),
+        "metrics": grader_metrics.snapshot(),
+        "usage": grader_metrics.usage_snapshot(),
     })
 
+
 @app.post("/api/admin/hw/<slug>/rerun")
 def api_admin_hw_rerun(slug):
     if not (session.get("netid") and session.get("is_admin")):
@@ -1871,6 +2001,7 @@ def api_admin_hw_rerun(slug):
     netid = (data.get("netid") or "").strip().lower()
     include_hidden = bool(data.get("include_hidden", False))  # admin toggle
     use_final = bool(data.get("use_final", True))             # default: latest final
+    bypass_cache = bool(data.get("bypass_cache", False))
 
     if not netid:
         return jsonify({"error": "missing_netid"}), 400
@@ -1882,17 +2013,10 @@ def api_admin_hw_rerun(slug):
     if not sub:
         return jsonify({"error": "no_submission"}), 404
 
-    root = (BASE_DIR / HOMEWORKS[slug]["root"]).resolve()
-
-    # Reuse the same loader logic as hw_submit (inline a small copy here)
-    files = {"student.py": sub.code or ""}
-    for p in sorted((root / "tests_public").glob("*.py")):
-        files[p.name] = p.read_text(encoding="utf-8")
-    if include_hidden and (root / "tests_hidden").exists():
-        for p in sorted((root / "tests_hidden").glob("*.py")):
-            files[p.name] = p.read_text(encoding="utf-8")
-
-    result = run_pytest_in_docker(files, timeout_s=15)
+    tests = homework_assets.get(slug).tests(include_hidden)
+    result = run_pytest_in_docker({"student.py": sub.code or ""}, tests=tests, timeout_s=15, netid=netid,
+                                  priority=PRIORITY_REGRADE, endpoint="hw_rerun", assignment=slug,
+                                  use_cache=not bypass_cache)
     result["cmd_display"] = "$ pytest -q" + (" (with hidden)" if include_hidden else "")
 
     return jsonify({
@@ -1916,60 +2040,124 @@ def api_admin_hw_regrade(slug):
 
     data = request.get_json(force=True) or {}
     include_hidden = bool(data.get("include_hidden", True))
+    bypass_cache = bool(data.get("bypass_cache", False))
+    # one container per GRADER_REGRADE_BATCH students instead of one each
+    batch = bool(data.get("batch", GRADER_REGRADE_USE_BATCH))
+
+    run_id, resumed = grader_regrade.start_or_resume(
+        slug, options={"include_hidden": include_hidden, "bypass_cache": bypass_cache, "batch": batch},
+        requested_by=session["netid"],
+    )
+    if not grader_regrade.is_running(run_id):
+        if GRADER_ASYNC:
+            grader_jobs.enqueue("hw_regrade", {"run_id": run_id}, netid=session["netid"])
+        else:
+            grader_regrade.start_in_thread(lambda: _run_hw_regrade_in_context(run_id))
+
+    return jsonify({
+        "ok": True,
+        "slug": slug,
+        "run_id": run_id,
+        "resumed": resumed,
+        "progress_url": url_for("api_admin_hw_regrade_progress", slug=slug, run_id=run_id),
+        "progress": grader_regrade.get_progress(run_id),
+    }), 202
+
+
+@app.get("/api/admin/hw/<slug>/regrade/<run_id>")
+def api_admin_hw_regrade_progress(slug, run_id):
+    if not (session.get("netid") and session.get("is_admin")):
+        return jsonify({"error": "not_admin"}), 403
+    prog = grader_regrade.get_progress(run_id)
+    if not prog or prog["slug"] != slug:
+        return jsonify({"error": "unknown_run"}), 404
+    return jsonify(prog)
+
+
+def _run_hw_regrade_in_context(run_id: str):
+    with app.app_context():
+        try:
+            _run_hw_regrade({"run_id": run_id})
+        except Exception:
+            app.logger.exception("regrade %s failed", run_id)
+        finally:
+            db.session.remove()
+
+
+def _run_hw_regrade(payload: dict):
+    run_id = payload["run_id"]
+    prog = grader_regrade.get_progress(run_id)
+    if not prog:
+        return {"error": "unknown_run"}, 404
 
-    # fetch all finals for this slug
+    slug = prog["slug"]
+    include_hidden = bool(prog["options"].get("include_hidden", True))
+    use_cache = not prog["options"].get("bypass_cache", False)
+    tests = homework_assets.get(slug).tests(include_hidden)   # once per run, not per student
+
+    # latest submitted row per netid
     subs = (HomeworkSubmission.query
         .filter(HomeworkSubmission.slug == slug)
         .filter(HomeworkSubmission.submitted_at.isnot(None))  # key change
         .order_by(HomeworkSubmission.netid.asc(), HomeworkSubmission.created_at.desc())
         .all())
 
-
-    # keep latest final per netid
     latest = {}
     for s in subs:
         if s.netid not in latest:
             latest[s.netid] = s
 
-    hw = HOMEWORKS[slug]
-    root = (BASE_DIR / hw["root"]).resolve()
-
-    changed = 0
-    details = []
-
-    for netid, sub in latest.items():
-        files = {"student.py": sub.code or ""}
-        for p in sorted((root / "tests_public").glob("*.py")):
-            files[p.name] = p.read_text(encoding="utf-8")
-        if include_hidden and (root / "tests_hidden").exists():
-            for p in sorted((root / "tests_hidden").glob("*.py")):
-                files[p.name] = p.read_text(encoding="utf-8")
-
-        result = run_pytest_in_docker(files, timeout_s=15)
+    items = [
+        (sub.id, {"netid": netid, "workspace": _workspace_from_submission(sub, slug)})
+        for netid, sub in latest.items()
+    ]
+    db.session.commit()   # don't hold the read transaction open while containers run
+
+    def grade_one(item):
+        result = run_pytest_in_docker(item["workspace"], tests=tests, timeout_s=15,
+                                      endpoint="hw_regrade", assignment=slug,
+                                      netid=item["netid"], priority=PRIORITY_REGRADE, use_cache=use_cache)
+        if is_infra_failure(result):
+            raise GraderInfraError(result.get("output") or f"exit {result.get('exit_code')}")
+        return result
+
+    def grade_many(batch):
+        results = run_pytest_batch_in_docker([item["workspace"] for item in batch], tests=tests,
+                                             endpoint="hw_regrade", assignment=slug,
+                                             timeout_s=15, priority=PRIORITY_REGRADE, use_cache=use_cache)
+        return [GraderInfraError(res.get("output") or "batch grader failed") if is_infra_failure(res) else res
+                for res in results]
+
+    def apply_batch(batch):
+        for sub_id, item, result in batch:
+            sub = HomeworkSubmission.query.get(sub_id)
+            if not sub:
+                continue
+            score_raw = _score_from_pytest_result(result)
+            # keep the originally stored late penalty fields
+            penalty_frac = float(sub.penalty_frac or 0.0)
+            score_final = (max(0.0, score_raw * (1.0 - penalty_frac)) if score_raw is not None else None)
+
+            reopen_penalty = float(sub.reopen_penalty_frac or 0.0)
+            score_final_after_reopen = (max(0.0, score_final * (1.0 - reopen_penalty)) if score_final is not None else None)
+
+            sub.result_json = _result_json_for_storage(result, _workspace=item["workspace"])
+            sub.report_json = _compact_report_json(result)
+            sub.score_raw = score_raw
+            sub.score_final = score_final
+            sub.score_final_after_reopen = score_final_after_reopen
+        db.session.commit()
 
-        score_raw = _score_from_pytest_result(result)
-        # keep the originally stored late penalty fields
-        penalty_frac = float(sub.penalty_frac or 0.0)
-        score_final = (max(0.0, score_raw * (1.0 - penalty_frac)) if score_raw is not None else None)
+    def on_progress(p):
+        socketio.emit("hw_regrade_progress", p, to=f"user:{p['requested_by']}")
 
-        reopen_penalty = float(sub.reopen_penalty_frac or 0.0)
-        score_final_after_reopen = (max(0.0, score_final * (1.0 - reopen_penalty)) if score_final is not None else None)
+    grader_regrade.run_regrade(run_id, items, grade_one, apply_batch, on_progress=on_progress,
+                               grade_many=grade_many if prog["options"].get("batch") else None)
+    return grader_regrade.get_progress(run_id), 200
 
-        sub.result_json = json.dumps(result)
-        sub.score_raw = score_raw
-        sub.score_final = score_final
-        sub.score_final_after_reopen = score_final_after_reopen
 
-        changed += 1
-        details.append({
-            "netid": netid,
-            "passed": result.get("passed", 0),
-            "failed": result.get("failed", 0),
-            "score_effective": (score_final_after_reopen if score_final_after_reopen is not None else score_final),
-        })
+grader_jobs.register("hw_regrade", _run_hw_regrade)
 
-    db.session.commit()
-    return jsonify({"ok": True, "slug": slug, "updated": changed, "details": details})
 
 
 @app.post("/api/admin/hw/<slug>/reopen")
@@ -2039,12 +2227,15 @@ def admin_hw_submission(slug):
 
     result_pretty = "{}"
     output_text = ""
+    report = None
     if sub:
         try:
-            result_pretty = json.dumps(json.loads(sub.result_json or "{}"), indent=2, sort_keys=True)
+            result = json.loads(sub.result_json or "{}")
+            result_pretty = json.dumps(result, indent=2, sort_keys=True)
+            output_text = result.get("output") or ""
         except Exception:
             result_pretty = sub.result_json or "{}"
-        output_text = sub.output_text or ""
+        report = _report_from_submission(sub)
 
     return render_template(
         "admin_hw_submission.html",
@@ -2053,6 +2244,7 @@ def admin_hw_submission(slug):
         sub=sub,
         result_pretty=result_pretty,
         output_text=output_text,
+        report=report,
     )
 
 
@@ -2233,6 +2425,13 @@ def set_section():
 
 
 
+@socketio.on("connect")
+def on_connect():
+    # per-user room so grading workers can push job results to this browser
+    netid = flask_session.get("netid")
+    if netid:
+        join_room(f"user:{netid}")
+
 @socketio.on("join_section")
 def on_join_section():
     sec = session.get("section")
@@ -3635,7 +3834,12 @@ def api_sandbox_run():
     data = request.get_json(silent=True) or {}
     code = data.get("code", "")
 
-    res = run_python_in_docker(code, timeout_s=3)
+    # streaming needs a per-user socket room; anonymous visitors get the buffered reply
+    if data.get("stream") and session.get("netid"):
+        return _start_streamed_run(data, code, [], netid=session["netid"], endpoint="sandbox_run", assignment="-")
+
+    res = run_python_in_docker(code, timeout_s=3, netid=session.get("netid") or request.remote_addr,
+                               priority=PRIORITY_RUN, endpoint="sandbox_run")
     return jsonify(stdout=res.get("stdout",""), stderr=res.get("stderr",""), exit_code=res.get("exit_code", 0))
 
 # ----- Weekly Challenge helpers (Redis-backed) -----
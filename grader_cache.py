@@ -0,0 +1,120 @@
+# grader_cache.py
+"""
+Content-addressed cache of pytest grading results.
+
+The key is a sha256 over the complete file map (workspace + tests), the
+grader image digest, the timeout and the pytest command, so a hit can only
+come from byte-identical inputs.  Entries live in Redis with an LRU index
+and are evicted oldest-first once the cache grows past GRADER_CACHE_MAX_BYTES.
+"""
+import hashlib, json, os, subprocess, time
+from typing import Any, Dict, List, Optional
+
+import redis
+
+import grader_metrics
+from extensions_redis import r
+
+
+GRADER_CACHE_ENABLED = os.environ.get("GRADER_CACHE_ENABLED", "1") == "1"
+GRADER_CACHE_MAX_BYTES = int(os.environ.get("GRADER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+GRADER_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("GRADER_CACHE_MAX_ENTRY_BYTES", str(512 * 1024)))
+GRADER_CACHE_TTL_S = int(os.environ.get("GRADER_CACHE_TTL_S", str(14 * 24 * 3600)))
+
+DATA_PREFIX = "grader:cache:data:"
+INDEX_KEY = "grader:cache:index"     # zset key -> last access
+SIZES_KEY = "grader:cache:sizes"     # hash key -> bytes
+BYTES_KEY = "grader:cache:bytes"
+
+_IMAGE_DIGEST_TTL_S = 60
+_image_digest: Dict[str, tuple] = {}
+
+
+def image_digest(docker_bin: str, image: str) -> str:
+    """Image id for `image`, re-checked every minute so a rebuilt image misses the cache."""
+    hit = _image_digest.get(image)
+    if hit and time.monotonic() - hit[1] < _IMAGE_DIGEST_TTL_S:
+        return hit[0]
+    digest = image
+    try:
+        p = subprocess.run([docker_bin, "image", "inspect", "--format", "{{.Id}}", image],
+                           capture_output=True, text=True, timeout=10)
+        if p.returncode == 0 and p.stdout.strip():
+            digest = p.stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    _image_digest[image] = (digest, time.monotonic())
+    return digest
+
+
+def cache_key(files: Dict[str, str], *, image_digest: str, timeout_s: float, cmd: List[str],
+              bundle_digest: str = "") -> str:
+    """bundle_digest stands in for a prebuilt FileBundle shipped alongside `files`."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"image": image_digest, "timeout_s": timeout_s, "cmd": cmd,
+                         "bundle": bundle_digest}, sort_keys=True).encode())
+    for name in sorted(files):
+        data = (files[name] or "").encode("utf-8")
+        h.update(b"\0F" + name.encode("utf-8") + b"\0" + str(len(data)).encode() + b"\0")
+        h.update(data)
+    return h.hexdigest()
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        blob = r.get(DATA_PREFIX + key)
+        if blob is None:
+            grader_metrics.incr("cache_miss")
+            return None
+        r.zadd(INDEX_KEY, {key: time.time()})
+    except redis.RedisError:
+        return None
+    grader_metrics.incr("cache_hit")
+    return json.loads(blob)
+
+
+def put(key: str, result: Dict[str, Any]):
+    blob = json.dumps(result, separators=(",", ":"))
+    size = len(blob)
+    if size > GRADER_CACHE_MAX_ENTRY_BYTES:
+        return
+    try:
+        old = int(r.hget(SIZES_KEY, key) or 0)
+        pipe = r.pipeline()
+        pipe.set(DATA_PREFIX + key, blob, ex=GRADER_CACHE_TTL_S)
+        pipe.zadd(INDEX_KEY, {key: time.time()})
+        pipe.hset(SIZES_KEY, key, size)
+        pipe.incrby(BYTES_KEY, size - old)
+        pipe.execute()
+        grader_metrics.incr("cache_store")
+        _evict()
+    except redis.RedisError:
+        pass
+
+
+def _evict():
+    while int(r.get(BYTES_KEY) or 0) > GRADER_CACHE_MAX_BYTES:
+        victims = r.zpopmin(INDEX_KEY, 16)
+        if not victims:
+            r.set(BYTES_KEY, 0)
+            return
+        for key, _ in victims:
+            size = int(r.hget(SIZES_KEY, key) or 0)
+            pipe = r.pipeline()
+            pipe.delete(DATA_PREFIX + key)
+            pipe.hdel(SIZES_KEY, key)
+            pipe.decrby(BYTES_KEY, size)
+            pipe.execute()
+        grader_metrics.incr("cache_evict", len(victims))
+
+
+def stats() -> dict:
+    try:
+        return {
+            "enabled": GRADER_CACHE_ENABLED,
+            "entries": r.zcard(INDEX_KEY),
+            "bytes": int(r.get(BYTES_KEY) or 0),
+            "max_bytes": GRADER_CACHE_MAX_BYTES,
+        }
+    except redis.RedisError:
+        return {"enabled": GRADER_CACHE_ENABLED}
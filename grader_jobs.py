@@ -0,0 +1,164 @@
+# grader_jobs.py
+"""
+Redis-backed grading job queue.
+
+The web process enqueues a job and returns its id right away; a separate
+`grader_worker.py` process pops jobs, runs the registered handler and stores
+the result under the job hash.  Handlers raise GraderInfraError when docker
+itself failed (not the student's code) and the job is retried with backoff.
+"""
+import json, os, time, uuid
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+from extensions_redis import REDIS_URL, r
+from grader_scheduler import SchedulerBusy
+
+
+GRADER_ASYNC = os.environ.get("GRADER_ASYNC", "0") == "1"
+GRADER_JOB_MAX_ATTEMPTS = int(os.environ.get("GRADER_JOB_MAX_ATTEMPTS", "3"))
+GRADER_JOB_TTL_S = int(os.environ.get("GRADER_JOB_TTL_S", str(24 * 3600)))
+
+QUEUE_KEY = "grader:jobs:queue"
+DELAYED_KEY = "grader:jobs:delayed"
+
+
+def _job_key(job_id: str) -> str:
+    return f"grader:job:{job_id}"
+
+
+class GraderInfraError(Exception):
+    """The sandbox could not run the job (docker down, image missing, ...)."""
+
+
+_handlers: Dict[str, Callable[[dict], tuple]] = {}
+
+
+def register(kind: str, fn: Callable[[dict], tuple]):
+    """fn(payload) -> (result_dict, http_status)"""
+    _handlers[kind] = fn
+
+
+def enqueue(kind: str, payload: dict, *, netid: str) -> str:
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    pipe = r.pipeline()
+    pipe.hset(_job_key(job_id), mapping={
+        "kind": kind,
+        "netid": netid,
+        "payload": json.dumps(payload),
+        "status": "queued",
+        "attempts": 0,
+        "created_at": now,
+    })
+    pipe.expire(_job_key(job_id), GRADER_JOB_TTL_S)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    h = r.hgetall(_job_key(job_id))
+    if not h:
+        return None
+    out = {
+        "job_id": job_id,
+        "kind": h.get("kind"),
+        "netid": h.get("netid"),
+        "status": h.get("status"),
+        "attempts": int(h.get("attempts") or 0),
+    }
+    if h.get("result"):
+        out["result"] = json.loads(h["result"])
+        out["http_status"] = int(h.get("http_status") or 200)
+    if h.get("error"):
+        out["error"] = h["error"]
+    return out
+
+
+def job_status_payload(job: dict) -> dict:
+    """Public view of a job for the status endpoint / socket push."""
+    return {k: v for k, v in job.items() if k not in ("netid", "kind")}
+
+
+# ---------- worker side ----------
+
+def _promote_delayed(conn):
+    now = time.time()
+    for job_id in conn.zrangebyscore(DELAYED_KEY, 0, now):
+        if conn.zrem(DELAYED_KEY, job_id):
+            conn.lpush(QUEUE_KEY, job_id)
+
+
+def _notify(job_id: str, netid: str):
+    job = get_job(job_id)
+    if not job or not netid:
+        return
+    try:
+        from extensions import socketio
+        socketio.emit("grader_job_done", job_status_payload(job), to=f"user:{netid}")
+    except Exception:
+        pass
+
+
+def process_one(conn, job_id: str, log=print):
+    key = _job_key(job_id)
+    h = conn.hgetall(key)
+    if not h:
+        return
+    kind = h.get("kind")
+    netid = h.get("netid") or ""
+    attempts = int(h.get("attempts") or 0) + 1
+    conn.hset(key, mapping={"status": "running", "attempts": attempts, "started_at": time.time()})
+
+    fn = _handlers.get(kind)
+    try:
+        if fn is None:
+            raise RuntimeError(f"no handler for job kind {kind!r}")
+        result, http_status = fn(json.loads(h.get("payload") or "{}"))
+    except (GraderInfraError, SchedulerBusy) as e:
+        if attempts < GRADER_JOB_MAX_ATTEMPTS:
+            log(f"[grader] job {job_id} infra failure (attempt {attempts}): {e}; retrying")
+            conn.hset(key, mapping={"status": "queued", "error": str(e)})
+            conn.zadd(DELAYED_KEY, {job_id: time.time() + 2 ** attempts})
+            return
+        log(f"[grader] job {job_id} giving up after {attempts} attempts: {e}")
+        conn.hset(key, mapping={"status": "failed", "error": str(e), "finished_at": time.time()})
+        _notify(job_id, netid)
+        return
+    except Exception as e:
+        log(f"[grader] job {job_id} crashed: {e!r}")
+        conn.hset(key, mapping={"status": "failed", "error": f"internal error: {e}", "finished_at": time.time()})
+        _notify(job_id, netid)
+        return
+
+    conn.hset(key, mapping={
+        "status": "done",
+        "result": json.dumps(result),
+        "http_status": int(http_status),
+        "finished_at": time.time(),
+    })
+    conn.hdel(key, "error")
+    _notify(job_id, netid)
+
+
+def run_worker(*, app=None, poll_s: float = 2.0, log=print):
+    # blocking pops need a connection without the web process' short socket timeout
+    conn = redis.from_url(REDIS_URL, decode_responses=True, socket_keepalive=True)
+    log(f"[grader] worker started, queue={QUEUE_KEY}")
+    while True:
+        _promote_delayed(conn)
+        item = conn.brpop(QUEUE_KEY, timeout=int(poll_s))
+        if not item:
+            continue
+        _, job_id = item
+        if app is not None:
+            with app.app_context():
+                try:
+                    process_one(conn, job_id, log=log)
+                finally:
+                    from extensions import db
+                    db.session.remove()
+        else:
+            process_one(conn, job_id, log=log)
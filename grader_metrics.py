@@ -0,0 +1,101 @@
+# grader_metrics.py
+"""
+Tiny shared counters for the grading sandbox, kept in one Redis hash so the
+web process and grading workers add up.  Never lets a Redis hiccup break a run.
+"""
+import redis
+
+from extensions_redis import r
+
+METRICS_KEY = "grader:metrics"
+
+
+def incr(name: str, by: float = 1):
+    try:
+        if isinstance(by, float):
+            r.hincrbyfloat(METRICS_KEY, name, by)
+        else:
+            r.hincrby(METRICS_KEY, name, by)
+    except redis.RedisError:
+        pass
+
+
+def observe(name: str, value: float):
+    """Record one sample: keeps <name>_count, <name>_sum and <name>_max."""
+    try:
+        pipe = r.pipeline()
+        pipe.hincrby(METRICS_KEY, f"{name}_count", 1)
+        pipe.hincrbyfloat(METRICS_KEY, f"{name}_sum", float(value))
+        pipe.execute()
+        cur = r.hget(METRICS_KEY, f"{name}_max")
+        if cur is None or float(cur) < value:
+            r.hset(METRICS_KEY, f"{name}_max", float(value))
+    except redis.RedisError:
+        pass
+
+
+def snapshot() -> dict:
+    try:
+        raw = r.hgetall(METRICS_KEY)
+    except redis.RedisError:
+        return {}
+    out = {}
+    for k, v in raw.items():
+        try:
+            out[k] = int(v)
+        except ValueError:
+            out[k] = float(v)
+    return out
+
+
+# ---- per-run resource usage, aggregated by endpoint and assignment ----
+
+USAGE_KEY = "grader:usage"
+
+
+def record_usage(endpoint: str, assignment: str, usage: dict):
+    """Fold one run's usage (see grader_workspace.StdinRun) into <endpoint>|<assignment>|<stat> fields."""
+    prefix = f"{endpoint}|{assignment}|"
+    cpu = float(usage.get("cpu_user_s") or 0) + float(usage.get("cpu_sys_s") or 0)
+    rss = int(usage.get("peak_rss_kb") or 0)
+    wall = float(usage.get("wall_s") or 0)
+    try:
+        pipe = r.pipeline()
+        pipe.hincrby(USAGE_KEY, prefix + "runs", 1)
+        pipe.hincrbyfloat(USAGE_KEY, prefix + "cpu_s_sum", cpu)
+        pipe.hincrbyfloat(USAGE_KEY, prefix + "wall_s_sum", wall)
+        pipe.hincrby(USAGE_KEY, prefix + "peak_rss_kb_sum", rss)
+        if usage.get("oom_killed"):
+            pipe.hincrby(USAGE_KEY, prefix + "oom_kills", 1)
+        if usage.get("timed_out"):
+            pipe.hincrby(USAGE_KEY, prefix + "timeouts", 1)
+        pipe.hmget(USAGE_KEY, [prefix + "cpu_s_max", prefix + "wall_s_max", prefix + "peak_rss_kb_max"])
+        cur = pipe.execute()[-1]
+        for field, value, old in (("cpu_s_max", cpu, cur[0]), ("wall_s_max", wall, cur[1]),
+                                  ("peak_rss_kb_max", rss, cur[2])):
+            if old is None or float(old) < value:
+                r.hset(USAGE_KEY, prefix + field, value)
+    except redis.RedisError:
+        pass
+
+
+def usage_snapshot() -> dict:
+    """{endpoint: {assignment: {runs, cpu_s_mean, cpu_s_max, wall_s_mean, ..., oom_kills, timeouts}}}"""
+    try:
+        raw = r.hgetall(USAGE_KEY)
+    except redis.RedisError:
+        return {}
+    out: dict = {}
+    for k, v in raw.items():
+        endpoint, assignment, stat = k.split("|", 2)
+        out.setdefault(endpoint, {}).setdefault(assignment, {})[stat] = float(v)
+    for per in out.values():
+        for st in per.values():
+            runs = int(st.get("runs") or 0)
+            st["runs"] = runs
+            for name in ("cpu_s", "wall_s", "peak_rss_kb"):
+                total = st.pop(f"{name}_sum", 0.0)
+                st[f"{name}_mean"] = round(total / runs, 3) if runs else None
+            st["oom_kills"] = int(st.get("oom_kills") or 0)
+            st["timeouts"] = int(st.get("timeouts") or 0)
+    return out
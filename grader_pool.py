@@ -0,0 +1,243 @@
+# grader_pool.py
+import atexit, subprocess, threading, time, uuid
+from typing import Dict, List, Optional
+
+from grader_workspace import WORKDIR, WORK_TMPFS, run_with_stdin_workspace
+
+
+POOL_LABEL = "foundations.pool"
+
+# Runs inside a pooled container after each checkout: kill anything the
+# student left behind (kill(-1) spares PID 1 and the caller) and wipe the
+# /tmp and /work tmpfs mounts.
+_SCRUB_PY = (
+    "import os, shutil, signal\n"
+    "try:\n"
+    "    os.kill(-1, signal.SIGKILL)\n"
+    "except OSError:\n"
+    "    pass\n"
+    f"for d in ('/tmp', {WORKDIR!r}):\n"
+    "    for n in os.listdir(d):\n"
+    "        p = os.path.join(d, n)\n"
+    "        shutil.rmtree(p, ignore_errors=True) if os.path.isdir(p) and not os.path.islink(p) else os.remove(p)\n"
+)
+
+
+class PooledContainer:
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+        self.started_at = time.monotonic()
+
+
+class ContainerPool:
+    """
+    Keeps `size` locked-down sandbox containers running (`sleep` as PID 1)
+    and hands them out one run at a time via `docker exec`.
+
+    Workspaces are streamed in over `docker exec -i` into a /work tmpfs, which
+    is wiped on checkin together with /tmp and any stray processes.  Containers
+    are recycled after `max_runs` runs, after a timeout, or when a health check
+    fails.  `run()` returns None when nothing is available so callers can fall
+    back to a cold `docker run --rm`.
+    """
+
+    def __init__(self, *, size: int, image: str, docker_bin: str, sandbox_flags: List[str],
+                 max_runs: int = 50, health_interval_s: float = 15.0, checkout_wait_s: float = 0.25):
+        self.size = size
+        self.image = image
+        self.docker_bin = docker_bin
+        self.sandbox_flags = list(sandbox_flags)
+        self.max_runs = max_runs
+        self.health_interval_s = health_interval_s
+        self.checkout_wait_s = checkout_wait_s
+
+        self._idle: List[PooledContainer] = []
+        self._busy: Dict[str, PooledContainer] = {}
+        self._starting = 0
+        self._cv = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- lifecycle ----
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._maintain, name="grader-pool", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            victims = self._idle + list(self._busy.values())
+            self._idle, self._busy = [], {}
+            self._cv.notify_all()
+        for c in victims:
+            self._destroy(c)
+
+    def stats(self) -> dict:
+        with self._cv:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "busy": len(self._busy),
+                "starting": self._starting,
+            }
+
+    def _spawn(self) -> Optional[PooledContainer]:
+        name = f"foundations-pool-{uuid.uuid4().hex[:12]}"
+        cmd = [
+            self.docker_bin, "run", "-d", "--rm",
+            "--name", name,
+            "--label", f"{POOL_LABEL}=1",
+            *self.sandbox_flags,
+            *WORK_TMPFS,
+            "-w", WORKDIR,
+            self.image,
+            "sleep", "infinity",
+        ]
+        try:
+            p = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            p = None
+        if p is None or p.returncode != 0:
+            return None
+        return PooledContainer(name)
+
+    def _destroy(self, c: PooledContainer):
+        try:
+            subprocess.run([self.docker_bin, "rm", "-f", c.name],
+                           capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    def _healthy(self, c: PooledContainer) -> bool:
+        try:
+            p = subprocess.run(
+                [self.docker_bin, "inspect", "-f", "{{.State.Running}}", c.name],
+                capture_output=True, text=True, timeout=10,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return p.returncode == 0 and p.stdout.strip() == "true"
+
+    def _maintain(self):
+        last_health = time.monotonic()
+        while True:
+            with self._cv:
+                if self._closed:
+                    return
+                missing = self.size - len(self._idle) - len(self._busy) - self._starting
+                if missing > 0:
+                    self._starting += missing
+
+            spawn_failed = False
+            for _ in range(max(0, missing)):
+                c = self._spawn()
+                spawn_failed = spawn_failed or c is None
+                with self._cv:
+                    self._starting -= 1
+                    if c and not self._closed:
+                        self._idle.append(c)
+                        self._cv.notify()
+                        c = None
+                if c:
+                    self._destroy(c)
+
+            if time.monotonic() - last_health >= self.health_interval_s:
+                last_health = time.monotonic()
+                with self._cv:
+                    candidates = list(self._idle)
+                for c in candidates:
+                    if self._healthy(c):
+                        continue
+                    with self._cv:
+                        if c not in self._idle:
+                            continue
+                        self._idle.remove(c)
+                    self._destroy(c)
+
+            # back off while the daemon is refusing to start containers
+            time.sleep(10.0 if spawn_failed else 1.0)
+
+    # ---- checkout / checkin ----
+
+    def checkout(self) -> Optional[PooledContainer]:
+        deadline = time.monotonic() + self.checkout_wait_s
+        with self._cv:
+            while not self._idle:
+                left = deadline - time.monotonic()
+                if self._closed or left <= 0:
+                    return None
+                self._cv.wait(left)
+            c = self._idle.pop()
+            self._busy[c.name] = c
+            return c
+
+    def checkin(self, c: PooledContainer, *, recycle: bool = False):
+        c.runs += 1
+        recycle = recycle or c.runs >= self.max_runs
+        threading.Thread(target=self._reset, args=(c, recycle), daemon=True).start()
+
+    def _reset(self, c: PooledContainer, recycle: bool):
+        if not recycle:
+            try:
+                p = subprocess.run(
+                    [self.docker_bin, "exec", c.name, "python", "-c", _SCRUB_PY],
+                    capture_output=True, text=True, timeout=10,
+                )
+                recycle = p.returncode != 0
+            except (OSError, subprocess.TimeoutExpired):
+                recycle = True
+
+        with self._cv:
+            self._busy.pop(c.name, None)
+            if not recycle and not self._closed:
+                self._idle.append(c)
+                self._cv.notify()
+                return
+        # the maintenance loop will top the pool back up
+        self._destroy(c)
+
+    # ---- execution ----
+
+    def exec_argv(self, c: PooledContainer) -> List[str]:
+        """`docker exec` prefix for callers that drive a checked-out container themselves."""
+        return [self.docker_bin, "exec", "-i", "-w", WORKDIR, c.name]
+
+    def run(self, files: Dict[str, str], inner_cmd: List[str], timeout_s: float, collect=(), bundle=None):
+        """
+        Run `inner_cmd` in /work of a warm container with `files` (and the
+        prebuilt `bundle`, if any) in place.
+        Returns a grader_workspace.StdinRun (output, the `collect` files that
+        exist afterwards, resource usage), raises TimeoutExpired like
+        subprocess.run, or returns None when no warm container could serve
+        the run.
+        """
+        c = self.checkout()
+        if c is None:
+            return None
+
+        recycle = False
+        try:
+            try:
+                ran = run_with_stdin_workspace(self.exec_argv(c), files, inner_cmd, timeout_s,
+                                               collect=collect, bundle=bundle)
+            except subprocess.TimeoutExpired:
+                # the exec'd process keeps running inside; throw the container away
+                recycle = True
+                raise
+            if ran.proc.returncode != 0 and (ran.proc.stderr or "").startswith("Error response from daemon"):
+                # the container died underneath us; let the caller cold-start
+                recycle = True
+                return None
+            if ran.usage and ran.usage.get("oom_killed"):
+                recycle = True   # don't hand the next student a container that just hit its limit
+            return ran
+        except OSError:
+            recycle = True
+            return None
+        finally:
+            self.checkin(c, recycle=recycle)
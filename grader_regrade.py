@@ -0,0 +1,206 @@
+# grader_regrade.py
+"""
+Bulk regrade engine.
+
+A regrade run is a Redis hash (grader:regrade:<run_id>) plus a set of the
+submission ids already committed.  Grading fans out over a bounded thread
+pool (each thread mostly waits on docker, and still takes a scheduler slot
+at regrade priority); the calling thread applies results to the DB in
+batches and only then checkpoints those ids, so an interrupted run resumes
+where its last batch left off.
+"""
+import json, os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from extensions_redis import r
+
+
+GRADER_REGRADE_PARALLELISM = int(os.environ.get("GRADER_REGRADE_PARALLELISM", "4"))
+GRADER_REGRADE_BATCH = int(os.environ.get("GRADER_REGRADE_BATCH", "25"))
+GRADER_REGRADE_USE_BATCH = os.environ.get("GRADER_REGRADE_USE_BATCH", "0") == "1"
+REGRADE_TTL_S = 7 * 24 * 3600
+LOCK_TTL_S = 120
+MAX_FAILURES_KEPT = 200
+
+
+def _key(run_id: str) -> str:
+    return f"grader:regrade:{run_id}"
+
+
+def _done_key(run_id: str) -> str:
+    return f"grader:regrade:{run_id}:done"
+
+
+def _failures_key(run_id: str) -> str:
+    return f"grader:regrade:{run_id}:failures"
+
+
+def _lock_key(run_id: str) -> str:
+    return f"grader:regrade:{run_id}:lock"
+
+
+def _active_key(slug: str) -> str:
+    return f"grader:regrade:active:{slug}"
+
+
+def start_or_resume(slug: str, *, options: dict, requested_by: str) -> Tuple[str, bool]:
+    """Return (run_id, resumed).  An unfinished run for `slug` is resumed rather than restarted."""
+    existing = r.get(_active_key(slug))
+    if existing and r.hget(_key(existing), "status") in ("queued", "running"):
+        return existing, True
+
+    run_id = uuid.uuid4().hex
+    pipe = r.pipeline()
+    pipe.hset(_key(run_id), mapping={
+        "slug": slug,
+        "options": json.dumps(options),
+        "requested_by": requested_by,
+        "status": "queued",
+        "total": 0,
+        "done": 0,
+        "failed": 0,
+        "created_at": time.time(),
+    })
+    pipe.expire(_key(run_id), REGRADE_TTL_S)
+    pipe.set(_active_key(slug), run_id, ex=REGRADE_TTL_S)
+    pipe.execute()
+    return run_id, False
+
+
+def is_running(run_id: str) -> bool:
+    return bool(r.exists(_lock_key(run_id)))
+
+
+def get_progress(run_id: str) -> Optional[Dict[str, Any]]:
+    h = r.hgetall(_key(run_id))
+    if not h:
+        return None
+    total, done = int(h.get("total") or 0), int(h.get("done") or 0)
+    started = float(h.get("started_at") or 0) or None
+    eta_s = None
+    if started and h.get("status") == "running" and done > int(h.get("resumed_from") or 0):
+        rate = (done - int(h.get("resumed_from") or 0)) / max(1e-6, time.time() - started)
+        eta_s = round((total - done) / rate, 1) if rate > 0 else None
+    return {
+        "run_id": run_id,
+        "slug": h.get("slug"),
+        "options": json.loads(h.get("options") or "{}"),
+        "requested_by": h.get("requested_by"),
+        "status": h.get("status"),
+        "total": total,
+        "done": done,
+        "failed": int(h.get("failed") or 0),
+        "eta_s": eta_s,
+        "failures": [json.loads(x) for x in r.lrange(_failures_key(run_id), 0, 20)],
+        "error": h.get("error"),
+    }
+
+
+def run_regrade(
+    run_id: str,
+    items: List[Tuple[int, dict]],
+    grade_one: Optional[Callable[[dict], dict]],
+    apply_batch: Callable[[List[Tuple[int, dict, dict]]], None],
+    *,
+    grade_many: Optional[Callable[[List[dict]], List[dict]]] = None,
+    parallelism: int = GRADER_REGRADE_PARALLELISM,
+    batch_size: int = GRADER_REGRADE_BATCH,
+    on_progress: Optional[Callable[[dict], None]] = None,
+):
+    """
+    items:       [(submission_id, item)] for the whole homework
+    grade_one:   item -> grader result (runs in pool threads; no DB access)
+    grade_many:  alternative to grade_one that grades batch_size items per
+                 call (one container per call, see run_pytest_batch_in_docker)
+    apply_batch: [(submission_id, item, result)] -> None; writes and commits (caller's thread)
+    """
+    lock_token = uuid.uuid4().hex
+    if not r.set(_lock_key(run_id), lock_token, nx=True, ex=LOCK_TTL_S):
+        return  # another process is already working on this run
+
+    key = _key(run_id)
+    try:
+        done_ids = {int(x) for x in r.smembers(_done_key(run_id))}
+        todo = [(sid, item) for sid, item in items if sid not in done_ids]
+        r.hset(key, mapping={
+            "status": "running",
+            "total": len(items),
+            "done": len(items) - len(todo),
+            "resumed_from": len(items) - len(todo),
+            "failed": 0,
+            "started_at": time.time(),
+        })
+        r.delete(_failures_key(run_id))
+
+        def report():
+            r.set(_lock_key(run_id), lock_token, xx=True, ex=LOCK_TTL_S)   # heartbeat
+            if on_progress:
+                try:
+                    on_progress(get_progress(run_id))
+                except Exception:
+                    pass
+
+        def flush(batch):
+            if not batch:
+                return
+            apply_batch(batch)
+            pipe = r.pipeline()
+            pipe.sadd(_done_key(run_id), *[sid for sid, _, _ in batch])
+            pipe.expire(_done_key(run_id), REGRADE_TTL_S)
+            pipe.hincrby(key, "done", len(batch))
+            pipe.execute()
+            report()
+
+        def fail(sid, item, e):
+            # left out of the done set, so a resumed run retries it
+            r.hincrby(key, "failed", 1)
+            r.rpush(_failures_key(run_id), json.dumps({
+                "submission_id": sid, "netid": item.get("netid"), "error": str(e)[:300],
+            }))
+            r.ltrim(_failures_key(run_id), 0, MAX_FAILURES_KEPT - 1)
+
+        if grade_many:
+            units = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+            run_unit = lambda unit: grade_many([item for _, item in unit])
+        else:
+            units = [[entry] for entry in todo]
+            run_unit = lambda unit: [grade_one(unit[0][1])]
+
+        pending: List[Tuple[int, dict, dict]] = []
+        with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="regrade") as pool:
+            futures = {pool.submit(run_unit, unit): unit for unit in units}
+            for fut in as_completed(futures):
+                unit = futures[fut]
+                try:
+                    unit_results = fut.result()
+                except Exception as e:
+                    for sid, item in unit:
+                        fail(sid, item, e)
+                    continue
+                for (sid, item), res in zip(unit, unit_results):
+                    if isinstance(res, Exception):
+                        fail(sid, item, res)
+                    else:
+                        pending.append((sid, item, res))
+                if len(pending) >= batch_size:
+                    flush(pending)
+                    pending = []
+        flush(pending)
+
+        r.hset(key, mapping={"status": "done", "finished_at": time.time()})
+        slug = r.hget(key, "slug")
+        if slug and r.get(_active_key(slug)) == run_id:
+            r.delete(_active_key(slug))
+        report()
+    except Exception as e:
+        # stays resumable: the next request for this slug picks the run back up
+        r.hset(key, mapping={"status": "queued", "error": str(e)[:300]})
+        raise
+    finally:
+        if r.get(_lock_key(run_id)) == lock_token:
+            r.delete(_lock_key(run_id))
+
+
+def start_in_thread(target: Callable[[], None]):
+    threading.Thread(target=target, name="regrade-runner", daemon=True).start()
@@ -0,0 +1,185 @@
+# grader_runtime/batch_supervisor.py
+"""
+Runs inside one grader container (started as root with only SETUID, SETGID,
+CHOWN, KILL and DAC_READ_SEARCH) and grades a whole batch of workspaces.
+
+stdin:  {"timeout_s": int, "parallelism": int, "cmd": [...], "report_name": str,
+         "workspaces": [{"name": content, ...}, ...]}
+stdout: [{"exit_code", "stdout", "stderr", "report_xml", "timed_out", "wall_s", "usage"}, ...]
+
+Each workspace gets its own uid, its own 0700 scratch dir (also its HOME and
+TMPDIR) and its own rlimits, so students in the same batch cannot see or
+touch each other.  Student output goes to root-owned files through inherited
+fds and never reaches this process' stdout directly.
+"""
+import json, os, resource, signal, subprocess, sys, time
+
+BASE_UID = 20000
+SCRATCH = "/tmp/batch"
+OUTPUT_MAX = 256 * 1024
+
+
+def _write_workspace(root, files, uid):
+    for name, content in files.items():
+        path = os.path.normpath(os.path.join(root, name))
+        if not path.startswith(root + os.sep):
+            continue   # no ../ escapes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content or "")
+    for dirpath, dirnames, filenames in os.walk(root):
+        os.chown(dirpath, uid, uid)
+        os.chmod(dirpath, 0o700)
+        for n in filenames:
+            os.chown(os.path.join(dirpath, n), uid, uid)
+
+
+def _read_capped(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(OUTPUT_MAX).decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def _kill_uid(uid):
+    """SIGKILL everything still running as `uid` (daemons that left the process group)."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setgid(uid)
+            os.setuid(uid)
+            os.kill(-1, signal.SIGKILL)
+        except OSError:
+            pass
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+class Job:
+    def __init__(self, idx, files, req):
+        self.idx = idx
+        self.uid = BASE_UID + idx
+        self.dir = os.path.join(SCRATCH, f"s{idx}")
+        self.out_path = os.path.join(SCRATCH, "out", f"{idx}.out")
+        self.err_path = os.path.join(SCRATCH, "out", f"{idx}.err")
+        self.files = files
+        self.req = req
+        self.proc = None
+        self.started = None
+        self.timed_out = False
+        self.rusage = None
+
+    def start(self):
+        os.makedirs(os.path.join(self.dir, ".tmp"), exist_ok=True)
+        _write_workspace(self.dir, self.files, self.uid)
+        timeout_s = self.req["timeout_s"]
+        uid = self.uid
+
+        def drop():
+            os.setsid()
+            resource.setrlimit(resource.RLIMIT_CPU, (timeout_s + 1, timeout_s + 1))
+            resource.setrlimit(resource.RLIMIT_AS, (1 << 30, 1 << 30))
+            resource.setrlimit(resource.RLIMIT_NPROC, (64, 64))
+            resource.setrlimit(resource.RLIMIT_FSIZE, (16 << 20, 16 << 20))
+            resource.setrlimit(resource.RLIMIT_NOFILE, (256, 256))
+            os.setgroups([])
+            os.setgid(uid)
+            os.setuid(uid)
+
+        env = {
+            "PATH": os.environ.get("PATH", "/usr/local/bin:/usr/bin:/bin"),
+            "HOME": self.dir,
+            "TMPDIR": os.path.join(self.dir, ".tmp"),
+            "PYTHONDONTWRITEBYTECODE": "1",
+            "LANG": "C.UTF-8",
+        }
+        out = open(self.out_path, "wb")
+        err = open(self.err_path, "wb")
+        try:
+            self.proc = subprocess.Popen(
+                self.req["cmd"], cwd=self.dir, env=env,
+                stdin=subprocess.DEVNULL, stdout=out, stderr=err,
+                preexec_fn=drop, close_fds=True,
+            )
+        finally:
+            out.close()
+            err.close()
+        self.started = time.monotonic()
+
+    def _reap(self, flags):
+        # wait4 instead of Popen.poll so we get this job's own rusage
+        pid, status, ru = os.wait4(self.proc.pid, flags)
+        if pid == 0:
+            return False
+        self.proc.returncode = os.waitstatus_to_exitcode(status)
+        self.rusage = ru
+        return True
+
+    def check(self):
+        if self._reap(os.WNOHANG):
+            return True
+        if time.monotonic() - self.started > self.req["timeout_s"]:
+            self.timed_out = True
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self._reap(0)
+            return True
+        return False
+
+    def result(self):
+        _kill_uid(self.uid)
+        wall_s = round(time.monotonic() - self.started, 3)
+        report = os.path.join(self.dir, self.req["report_name"])
+        stderr = _read_capped(self.err_path)
+        if self.timed_out:
+            stderr += "\nTimed out.\n"
+        return {
+            "exit_code": 124 if self.timed_out else self.proc.returncode,
+            "stdout": _read_capped(self.out_path),
+            "stderr": stderr,
+            # islink: a student could point the report at someone else's file
+            "report_xml": _read_capped(report) if os.path.isfile(report) and not os.path.islink(report) else None,
+            "timed_out": self.timed_out,
+            "wall_s": wall_s,
+            "usage": {
+                "cpu_user_s": round(self.rusage.ru_utime, 3),
+                "cpu_sys_s": round(self.rusage.ru_stime, 3),
+                "peak_rss_kb": self.rusage.ru_maxrss,
+                "wall_s": wall_s,
+                # SIGKILL we did not send: the cgroup OOM killer (RLIMIT_AS gives MemoryError instead)
+                "oom_killed": self.proc.returncode == -signal.SIGKILL and not self.timed_out,
+            },
+        }
+
+
+def main():
+    req = json.load(sys.stdin)
+    os.makedirs(os.path.join(SCRATCH, "out"), exist_ok=True)
+    os.chmod(SCRATCH, 0o711)
+    os.chmod(os.path.join(SCRATCH, "out"), 0o700)
+
+    jobs = [Job(i, ws, req) for i, ws in enumerate(req["workspaces"])]
+    waiting = list(jobs)
+    running = []
+    results = [None] * len(jobs)
+    parallelism = max(1, int(req.get("parallelism") or 1))
+
+    while waiting or running:
+        while waiting and len(running) < parallelism:
+            j = waiting.pop(0)
+            j.start()
+            running.append(j)
+        for j in list(running):
+            if j.check():
+                running.remove(j)
+                results[j.idx] = j.result()
+        time.sleep(0.01)
+
+    json.dump(results, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# grader_runtime/zygote.py
+"""
+Fork server for student runs.  Runs as PID 1's child inside one long-lived
+grader container (root with only SETUID, SETGID, CHOWN, KILL and
+DAC_READ_SEARCH), imports pytest and the usual stdlib once, and then forks a
+fresh child per request, so a run costs a fork instead of an interpreter
+start-up plus imports.
+
+stdin:  one JSON request per line
+        {"id", "mode": "python"|"pytest", "files": {...}, "args": [...],
+         "timeout_s", "pytest_args": [...], "report_name"}
+stdout: one JSON result per line
+        {"id", "exit_code", "stdout", "stderr", "report_xml", "timed_out", "usage"}
+
+Each child gets a slot: its own uid, its own 0700 working directory (wiped
+after the run, as that uid), rlimits, a new session, and a seccomp filter
+that refuses ptrace / mount / namespace / keyring / bpf syscalls.  Per-run
+unshare() is not attempted: it needs CAP_SYS_ADMIN, which the container does
+not get; the container's own namespaces (network none, private pid/ipc)
+already fence the whole server in.
+"""
+import ctypes, json, os, platform, resource, selectors, shutil, signal, sys, time
+
+# pre-initialise what student code and the tests will import anyway
+import collections, dataclasses, functools, itertools, math, random, re, string, typing  # noqa: F401
+import runpy
+import pytest  # noqa: F401
+import _pytest.junitxml  # noqa: F401
+
+BASE_UID = 30000
+SCRATCH = "/tmp/zygote"
+OUTPUT_MAX = 256 * 1024
+PARALLELISM = max(1, int(os.environ.get("ZYGOTE_PARALLELISM", "2")))
+
+
+# ---------- seccomp (classic BPF via prctl) ----------
+
+_AUDIT_ARCH = {"x86_64": 0xC000003E, "aarch64": 0xC00000B7}
+_DENY = {
+    # ptrace mount umount2 unshare setns keyctl add_key request_key bpf perf_event_open process_vm_readv/writev
+    "x86_64": (101, 165, 166, 272, 308, 250, 248, 249, 321, 298, 310, 311),
+    "aarch64": (117, 40, 39, 97, 268, 219, 217, 218, 280, 241, 270, 271),
+}
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte), ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def _install_seccomp():
+    arch = platform.machine()
+    if arch not in _DENY:
+        return
+    LD, JEQ, JGE, RET = 0x20, 0x15, 0x35, 0x06
+    ALLOW, EPERM, KILL = 0x7FFF0000, 0x00050001, 0x80000000
+    prog = [
+        (LD, 0, 0, 4),                        # seccomp_data.arch
+        (JEQ, 1, 0, _AUDIT_ARCH[arch]),
+        (RET, 0, 0, KILL),                    # foreign ABI (i386 / x32 entry points)
+        (LD, 0, 0, 0),                        # seccomp_data.nr
+        (JGE, 0, 1, 0x40000000),              # x32 syscall numbers
+        (RET, 0, 0, EPERM),
+    ]
+    for nr in _DENY[arch]:
+        prog += [(JEQ, 0, 1, nr), (RET, 0, 0, EPERM)]
+    prog.append((RET, 0, 0, ALLOW))
+
+    filters = (_SockFilter * len(prog))(*[_SockFilter(*f) for f in prog])
+    fprog = _SockFprog(len(prog), filters)
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.prctl(38, 1, 0, 0, 0)                                 # PR_SET_NO_NEW_PRIVS
+    libc.prctl(22, 2, ctypes.byref(fprog), 0, 0)              # PR_SET_SECCOMP, SECCOMP_MODE_FILTER
+
+
+# ---------- helpers ----------
+
+def _as_uid(uid, fn):
+    """Run fn() in a forked child with `uid` (kill its leftovers, wipe its files)."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setgroups([])
+            os.setgid(uid)
+            os.setuid(uid)
+            fn()
+        except BaseException:
+            pass
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def _kill_all():
+    try:
+        os.kill(-1, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def _read_capped(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(OUTPUT_MAX).decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def _write_files(root, files):
+    for name, content in files.items():
+        path = os.path.normpath(os.path.join(root, name))
+        if not path.startswith(root + os.sep):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content or "")
+
+
+def _wipe(root):
+    for n in os.listdir(root):
+        p = os.path.join(root, n)
+        if os.path.isdir(p) and not os.path.islink(p):
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            os.remove(p)
+
+
+def _chown_tree(root, uid):
+    for dirpath, _, filenames in os.walk(root):
+        os.chown(dirpath, uid, uid)
+        for n in filenames:
+            os.chown(os.path.join(dirpath, n), uid, uid)
+
+
+# ---------- one run ----------
+
+class Run:
+    def __init__(self, req, slot):
+        self.req = req
+        self.slot = slot
+        self.uid = BASE_UID + slot
+        self.dir = os.path.join(SCRATCH, f"s{slot}")
+        self.out_path = os.path.join(SCRATCH, "out", f"{slot}.out")
+        self.err_path = os.path.join(SCRATCH, "out", f"{slot}.err")
+        self.pid = None
+        self.started = None
+        self.timed_out = False
+        self.status = None
+        self.rusage = None
+
+    def start(self):
+        os.makedirs(self.dir, exist_ok=True)
+        os.chmod(self.dir, 0o700)
+        _write_files(self.dir, self.req.get("files") or {})
+        os.makedirs(os.path.join(self.dir, ".tmp"), exist_ok=True)
+        _chown_tree(self.dir, self.uid)
+        out = os.open(self.out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        err = os.open(self.err_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+        self.started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            self._child(out, err)   # never returns
+        os.close(out)
+        os.close(err)
+        self.pid = pid
+
+    def _child(self, out, err):
+        code = 125
+        try:
+            timeout_s = int(self.req.get("timeout_s") or 3)
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out, 1)
+            os.dup2(err, 2)
+            os.closerange(3, 1024)
+            resource.setrlimit(resource.RLIMIT_CPU, (timeout_s + 1, timeout_s + 1))
+            resource.setrlimit(resource.RLIMIT_AS, (1 << 30, 1 << 30))
+            resource.setrlimit(resource.RLIMIT_NPROC, (64, 64))
+            resource.setrlimit(resource.RLIMIT_FSIZE, (16 << 20, 16 << 20))
+            resource.setrlimit(resource.RLIMIT_NOFILE, (256, 256))
+            os.setgroups([])
+            os.setgid(self.uid)
+            os.setuid(self.uid)
+            try:
+                _install_seccomp()
+            except Exception:
+                pass   # best effort; the container profile still applies
+
+            os.chdir(self.dir)
+            os.environ.clear()
+            os.environ.update({"HOME": self.dir, "TMPDIR": os.path.join(self.dir, ".tmp"),
+                               "PATH": "/usr/local/bin:/usr/bin:/bin", "LANG": "C.UTF-8",
+                               "PYTHONDONTWRITEBYTECODE": "1"})
+            sys.stdin = open(0, "r", closefd=False)
+            sys.stdout = open(1, "w", closefd=False, buffering=1)
+            sys.stderr = open(2, "w", closefd=False, buffering=1)
+            sys.dont_write_bytecode = True
+            sys.path.insert(0, self.dir)
+
+            if self.req.get("mode") == "pytest":
+                code = int(pytest.main(list(self.req.get("pytest_args") or [])))
+            else:
+                sys.argv = ["main.py", *(self.req.get("args") or [])]
+                try:
+                    runpy.run_path("main.py", run_name="__main__")
+                    code = 0
+                except SystemExit as e:
+                    c = e.code
+                    code = c if isinstance(c, int) else (0 if c is None else 1)
+                    if not isinstance(c, (int, type(None))):
+                        print(c, file=sys.stderr)
+                except BaseException:
+                    import traceback
+                    traceback.print_exc()
+                    code = 1
+        except BaseException:
+            code = 125
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except Exception:
+                pass
+            os._exit(code & 0xFF)
+
+    def poll(self):
+        if self.status is None:
+            pid, status, ru = os.wait4(self.pid, os.WNOHANG)
+            if pid:
+                self.status, self.rusage = status, ru
+                return True
+            limit = float(self.req.get("timeout_s") or 3)
+            if time.monotonic() - self.started > limit:
+                self.timed_out = True
+                try:
+                    os.killpg(self.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                _, self.status, self.rusage = os.wait4(self.pid, 0)
+                return True
+            return False
+        return True
+
+    def result(self):
+        _as_uid(self.uid, _kill_all)   # daemons that left the session
+        wall_s = round(time.monotonic() - self.started, 3)
+        rc = os.waitstatus_to_exitcode(self.status)
+        report_xml = None
+        name = self.req.get("report_name")
+        if name:
+            path = os.path.join(self.dir, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                report_xml = _read_capped(path)
+        stderr = _read_capped(self.err_path)
+        if self.timed_out:
+            stderr += "\nTimed out.\n"
+        res = {
+            "id": self.req.get("id"),
+            "exit_code": 124 if self.timed_out else (128 - rc if rc < 0 else rc),
+            "stdout": _read_capped(self.out_path),
+            "stderr": stderr,
+            "report_xml": report_xml,
+            "timed_out": self.timed_out,
+            "usage": {
+                "cpu_user_s": round(self.rusage.ru_utime, 3),
+                "cpu_sys_s": round(self.rusage.ru_stime, 3),
+                "peak_rss_kb": self.rusage.ru_maxrss,
+                "wall_s": wall_s,
+                "oom_killed": rc == -signal.SIGKILL and not self.timed_out,
+            },
+        }
+        _as_uid(self.uid, lambda: _wipe(self.dir))
+        return res
+
+
+# ---------- server loop ----------
+
+def main():
+    os.makedirs(os.path.join(SCRATCH, "out"), exist_ok=True)
+    os.chmod(SCRATCH, 0o711)
+    os.chmod(os.path.join(SCRATCH, "out"), 0o700)
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    sel = selectors.DefaultSelector()
+    stdin = sys.stdin.buffer
+    os.set_blocking(stdin.fileno(), False)
+    sel.register(stdin, selectors.EVENT_READ)
+    buf = b""
+    eof = False
+    waiting = []
+    running = {}
+    free = list(range(PARALLELISM))
+
+    def send(obj):
+        sys.stdout.write(json.dumps(obj) + "\n")
+        sys.stdout.flush()
+
+    send({"ready": True, "parallelism": PARALLELISM})
+    while not (eof and not waiting and not running):
+        for _ in sel.select(timeout=0.005 if running else 0.5):
+            chunk = os.read(stdin.fileno(), 1 << 16)
+            if not chunk:
+                eof = True
+                sel.unregister(stdin)
+                break
+            buf += chunk
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                if line.strip():
+                    try:
+                        waiting.append(json.loads(line))
+                    except ValueError:
+                        pass
+
+        while waiting and free:
+            run = Run(waiting.pop(0), free.pop(0))
+            try:
+                run.start()
+                running[run.slot] = run
+            except Exception as e:
+                free.append(run.slot)
+                send({"id": run.req.get("id"), "exit_code": 125, "stdout": "",
+                      "stderr": f"zygote could not start run: {e}", "report_xml": None,
+                      "timed_out": False, "usage": None})
+
+        for slot, run in list(running.items()):
+            if run.poll():
+                del running[slot]
+                send(run.result())
+                free.append(slot)
+
+
+if __name__ == "__main__":
+    main()
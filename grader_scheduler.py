@@ -0,0 +1,239 @@
+# grader_scheduler.py
+"""
+Admission control in front of the docker runners.
+
+Every sandbox execution takes a slot first.  Slots are capped per host
+(GRADER_MAX_CONCURRENT) through short-lived leases in Redis, so the web
+process and any grading workers on the same box share one budget; if Redis
+is unreachable we fall back to a per-process cap.
+
+Waiters are served by priority class (final submit > check > run > admin
+regrade) and round-robin across netids inside a class, so one student
+hammering Run cannot starve the rest of the room.  When the queue is too
+deep we refuse up front with SchedulerBusy, which the app turns into a
+429/503 with Retry-After.
+"""
+import os, socket, threading, time, uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional
+
+import redis
+
+import grader_metrics
+from extensions_redis import r
+
+
+PRIORITY_SUBMIT = 0
+PRIORITY_CHECK = 1
+PRIORITY_RUN = 2
+PRIORITY_REGRADE = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_SUBMIT: "submit",
+    PRIORITY_CHECK: "check",
+    PRIORITY_RUN: "run",
+    PRIORITY_REGRADE: "regrade",
+}
+
+GRADER_MAX_CONCURRENT = int(os.environ.get("GRADER_MAX_CONCURRENT", str(os.cpu_count() or 2)))
+GRADER_MAX_QUEUE = int(os.environ.get("GRADER_MAX_QUEUE", "200"))
+GRADER_MAX_QUEUE_PER_USER = int(os.environ.get("GRADER_MAX_QUEUE_PER_USER", "2"))
+GRADER_MAX_WAIT_S = float(os.environ.get("GRADER_MAX_WAIT_S", "20"))
+
+_ACQUIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+  return 1
+end
+return 0
+"""
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status            # 429 = you, 503 = everyone
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Ticket:
+    __slots__ = ("netid", "priority", "enqueued_at")
+
+    def __init__(self, netid: str, priority: int):
+        self.netid = netid
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class ExecScheduler:
+    def __init__(self, *, max_concurrent: int, max_queue: int, max_queue_per_user: int, max_wait_s: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait_s = max_wait_s
+
+        self.slots_key = f"grader:slots:{socket.gethostname()}"
+        self._acquire = r.register_script(_ACQUIRE_LUA)
+
+        self._cv = threading.Condition()
+        # priority -> OrderedDict(netid -> deque[_Ticket]); dict order is the round-robin order
+        self._waiting = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._running_local = 0
+        self._recent_waits = deque(maxlen=500)
+        self._recent_runs = deque(maxlen=200)
+
+    # ---- queue bookkeeping (call with self._cv held) ----
+
+    def _depth(self) -> int:
+        return sum(len(q) for per in self._waiting.values() for q in per.values())
+
+    def _depth_for(self, netid: str) -> int:
+        return sum(len(per.get(netid, ())) for per in self._waiting.values())
+
+    def _head(self) -> Optional[_Ticket]:
+        for p in sorted(self._waiting):
+            per = self._waiting[p]
+            if per:
+                return next(iter(per.values()))[0]
+        return None
+
+    def _remove(self, t: _Ticket, *, served: bool):
+        per = self._waiting[t.priority]
+        q = per.get(t.netid)
+        if not q:
+            return
+        try:
+            q.remove(t)
+        except ValueError:
+            return
+        if not q:
+            del per[t.netid]
+        elif served:
+            per.move_to_end(t.netid)   # next turn goes to someone else
+
+    def _retry_after(self) -> int:
+        avg = (sum(self._recent_runs) / len(self._recent_runs)) if self._recent_runs else 2.0
+        est = avg * (self._depth() + 1) / max(1, self.max_concurrent)
+        return max(1, int(round(est)))
+
+    # ---- host-wide slots ----
+
+    def _take_slot(self, lease_id: str, lease_s: float) -> bool:
+        now = time.time()
+        try:
+            return bool(self._acquire(keys=[self.slots_key],
+                                      args=[now, self.max_concurrent, now + lease_s, lease_id]))
+        except redis.RedisError:
+            with self._cv:
+                if self._running_local < self.max_concurrent:
+                    return True
+            return False
+
+    def _give_slot(self, lease_id: str):
+        try:
+            r.zrem(self.slots_key, lease_id)
+        except redis.RedisError:
+            pass
+
+    # ---- public ----
+
+    @contextmanager
+    def slot(self, netid: Optional[str], priority: int, *, lease_s: float, shed: bool = True):
+        """
+        Hold one execution slot for the duration of the block.  lease_s bounds
+        how long a crashed holder can keep the slot.  shed=False waits as long
+        as it takes (admin regrades) instead of raising SchedulerBusy.
+        """
+        netid = netid or "anonymous"
+        t = _Ticket(netid, priority)
+        lease_id = uuid.uuid4().hex
+        name = PRIORITY_NAMES.get(priority, str(priority))
+
+        with self._cv:
+            if shed and self._depth() >= self.max_queue:
+                grader_metrics.incr("sched_shed_503")
+                raise SchedulerBusy(503, self._retry_after(), "sandbox_busy")
+            if shed and self._depth_for(netid) >= self.max_queue_per_user:
+                grader_metrics.incr("sched_shed_429")
+                raise SchedulerBusy(429, self._retry_after(), "too_many_runs")
+            self._waiting[priority].setdefault(netid, deque()).append(t)
+
+        try:
+            while True:
+                with self._cv:
+                    is_head = self._head() is t
+                if is_head and self._take_slot(lease_id, lease_s):
+                    with self._cv:
+                        self._remove(t, served=True)
+                        self._running_local += 1
+                        self._cv.notify_all()
+                    break
+                with self._cv:
+                    waited = time.monotonic() - t.enqueued_at
+                    if shed and waited >= self.max_wait_s:
+                        self._remove(t, served=False)
+                        self._cv.notify_all()
+                        grader_metrics.incr("sched_shed_timeout")
+                        raise SchedulerBusy(503, self._retry_after(), "sandbox_busy")
+                    # the head polls the host-wide slots; everyone else waits for a nudge
+                    self._cv.wait(0.05 if is_head else 0.5)
+        except BaseException:
+            with self._cv:
+                self._remove(t, served=False)
+                self._cv.notify_all()
+            raise
+
+        waited = time.monotonic() - t.enqueued_at
+        grader_metrics.observe("sched_wait_s", waited)
+        grader_metrics.incr(f"sched_runs_{name}")
+        with self._cv:
+            self._recent_waits.append(waited)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._give_slot(lease_id)
+            with self._cv:
+                self._running_local -= 1
+                self._recent_runs.append(time.monotonic() - started)
+                self._cv.notify_all()
+
+    def stats(self) -> dict:
+        try:
+            now = time.time()
+            r.zremrangebyscore(self.slots_key, "-inf", now)
+            host_running = r.zcard(self.slots_key)
+        except redis.RedisError:
+            host_running = None
+        with self._cv:
+            waits = sorted(self._recent_waits)
+
+            def pct(q):
+                return round(waits[min(len(waits) - 1, int(q * len(waits)))], 3) if waits else None
+
+            return {
+                "host": socket.gethostname(),
+                "max_concurrent": self.max_concurrent,
+                "host_running": host_running,
+                "process_running": self._running_local,
+                "queue_depth": self._depth(),
+                "queue_by_priority": {
+                    PRIORITY_NAMES[p]: sum(len(q) for q in per.values())
+                    for p, per in self._waiting.items()
+                },
+                "wait_p50_s": pct(0.50),
+                "wait_p95_s": pct(0.95),
+                "wait_max_s": round(waits[-1], 3) if waits else None,
+            }
+
+
+scheduler = ExecScheduler(
+    max_concurrent=GRADER_MAX_CONCURRENT,
+    max_queue=GRADER_MAX_QUEUE,
+    max_queue_per_user=GRADER_MAX_QUEUE_PER_USER,
+    max_wait_s=GRADER_MAX_WAIT_S,
+)
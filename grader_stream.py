@@ -0,0 +1,119 @@
+# grader_stream.py
+"""
+Live output for Run buttons.
+
+pump() reads a running sandbox's stdout/stderr as it arrives and hands
+coalesced chunks to a callback (the app forwards them over Socket.IO).
+Forwarding is capped per run (GRADER_STREAM_MAX_BYTES, then the run is
+killed) and paced (GRADER_STREAM_MAX_BPS): while we are ahead of the pace we
+simply stop reading, the pipe fills, and the student's program blocks on
+print() until the socket side catches up.  Nothing is buffered beyond one
+flush window.
+"""
+import codecs, os, selectors, signal, subprocess, time
+from typing import Callable, Dict, List, Tuple
+
+GRADER_STREAM_MAX_BYTES = int(os.environ.get("GRADER_STREAM_MAX_BYTES", str(256 * 1024)))
+GRADER_STREAM_MAX_BPS = int(os.environ.get("GRADER_STREAM_MAX_BPS", str(64 * 1024)))
+GRADER_STREAM_FLUSH_S = float(os.environ.get("GRADER_STREAM_FLUSH_S", "0.05"))
+
+READ_SIZE = 4096
+
+
+def _exit_code(p: subprocess.Popen) -> int:
+    rc = p.returncode
+    return 128 - rc if rc is not None and rc < 0 else rc   # killed by signal N -> 128+N, like a shell
+
+
+def pump(p: subprocess.Popen, on_output: Callable[[str, str], None], *, timeout_s: float,
+         max_bytes: int = GRADER_STREAM_MAX_BYTES, max_bps: int = GRADER_STREAM_MAX_BPS,
+         flush_s: float = GRADER_STREAM_FLUSH_S) -> Dict:
+    """
+    Forward p's output to on_output(stream, text) until it exits, times out
+    or exceeds max_bytes.  Returns the final frame:
+      {"exit_code", "timed_out", "truncated", "bytes", "wall_s"}
+    """
+    started = time.monotonic()
+    deadline = started + timeout_s
+    sel = selectors.DefaultSelector()
+    sel.register(p.stdout, selectors.EVENT_READ, "stdout")
+    sel.register(p.stderr, selectors.EVENT_READ, "stderr")
+    decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+
+    pending: List[Tuple[str, str]] = []
+    total = 0
+    timed_out = truncated = False
+    last_flush = started
+
+    def flush():
+        # merge consecutive pieces of the same stream, keep stdout/stderr order
+        merged: List[Tuple[str, str]] = []
+        for name, text in pending:
+            if merged and merged[-1][0] == name:
+                merged[-1] = (name, merged[-1][1] + text)
+            else:
+                merged.append((name, text))
+        pending.clear()
+        for name, text in merged:
+            if text:
+                on_output(name, text)
+
+    try:
+        while sel.get_map():
+            now = time.monotonic()
+            if now >= deadline:
+                timed_out = True
+                break
+            if now - last_flush >= flush_s:
+                flush()
+                last_flush = now
+
+            # backpressure: ahead of pace (plus a quarter-second burst) -> don't read
+            if max_bps and total > max_bps * (now - started + 0.25):
+                time.sleep(min(flush_s, deadline - now))
+                continue
+
+            for key, _ in sel.select(timeout=min(flush_s, max(0.0, deadline - now))):
+                data = os.read(key.fileobj.fileno(), READ_SIZE)
+                if not data:
+                    sel.unregister(key.fileobj)
+                    pending.append((key.data, decoders[key.data].decode(b"", final=True)))
+                    continue
+                if total + len(data) > max_bytes:
+                    data = data[:max_bytes - total]
+                    truncated = True
+                total += len(data)
+                pending.append((key.data, decoders[key.data].decode(data)))
+            if truncated:
+                break
+        if not (timed_out or truncated):
+            # both pipes hit EOF; give the process the rest of its time to exit
+            try:
+                p.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+    finally:
+        sel.close()
+        if p.poll() is None:
+            try:
+                p.send_signal(signal.SIGKILL)
+            except OSError:
+                pass
+        flush()
+        for f in (p.stdout, p.stderr):
+            try:
+                f.close()
+            except OSError:
+                pass
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    return {
+        "exit_code": 124 if timed_out else _exit_code(p),
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "bytes": total,
+        "wall_s": round(time.monotonic() - started, 3),
+    }
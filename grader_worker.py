@@ -0,0 +1,8 @@
+# grader_worker.py
+# Run one or more of these next to the web process when GRADER_ASYNC=1:
+#   python grader_worker.py
+from app import app
+from grader_jobs import run_worker
+
+if __name__ == "__main__":
+    run_worker(app=app)
@@ -0,0 +1,155 @@
+# grader_workspace.py
+"""
+Disk-free workspace delivery.
+
+The file map is packed into an in-memory tar and piped to the container on
+stdin; a tiny bootstrap (STDIN_EXEC_PY, run with `python -c`) unpacks it into
+the container's /work tmpfs and then runs the real command.  Nothing is
+written to the host, so there is nothing to chmod, bind-mount or clean up.
+
+Files named in `collect` (e.g. the JUnit report) and the run's resource usage
+come back on stdout after the command's own output, behind COLLECT_MARKER.
+"""
+import hashlib, json, subprocess, tarfile, time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+WORKDIR = "/work"
+
+# per-run /work for cold containers; pooled containers mount it once
+WORK_TMPFS = ["--tmpfs", f"{WORKDIR}:rw,nosuid,nodev,noexec,size=64m,mode=1777"]
+
+COLLECT_MARKER = "\x00foundations-collect\x00"
+
+# Per-run accounting: CPU and peak RSS come from the command's rusage (exact
+# for this run even in a reused pool container); OOM kills from the delta of
+# the container cgroup's oom_kill counter (v2 memory.events, v1 oom_control).
+STDIN_EXEC_PY = (
+    "import json, os, resource, subprocess, sys, tarfile, time\n"
+    "with tarfile.open(fileobj=sys.stdin.buffer, mode='r|') as tf:\n"
+    "    tf.extractall('.', **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))\n"
+    "opts = json.loads(sys.argv[1])\n"
+    "if not opts.get('collect') and not opts.get('usage'):\n"
+    "    os.execvp(sys.argv[2], sys.argv[2:])\n"
+    "def oom_kills():\n"
+    "    for path in ('/sys/fs/cgroup/memory.events', '/sys/fs/cgroup/memory/memory.oom_control'):\n"
+    "        try:\n"
+    "            with open(path) as f:\n"
+    "                for line in f:\n"
+    "                    k, _, v = line.partition(' ')\n"
+    "                    if k == 'oom_kill':\n"
+    "                        return int(v)\n"
+    "        except (OSError, ValueError):\n"
+    "            pass\n"
+    "    return 0\n"
+    "oom0, t0 = oom_kills(), time.monotonic()\n"
+    "rc = subprocess.call(sys.argv[2:], stdin=subprocess.DEVNULL)\n"
+    "wall = time.monotonic() - t0\n"
+    "ru = resource.getrusage(resource.RUSAGE_CHILDREN)\n"
+    "out = {'files': {}, 'usage': {\n"
+    "    'cpu_user_s': round(ru.ru_utime, 3), 'cpu_sys_s': round(ru.ru_stime, 3),\n"
+    "    'peak_rss_kb': ru.ru_maxrss, 'wall_s': round(wall, 3), 'oom_killed': oom_kills() > oom0}}\n"
+    "for n in opts.get('collect') or ():\n"
+    "    if os.path.isfile(n) and not os.path.islink(n):\n"
+    "        with open(n, encoding='utf-8', errors='replace') as f:\n"
+    "            out['files'][n] = f.read()\n"
+    f"sys.stdout.write('\\n' + {COLLECT_MARKER!r} + json.dumps(out))\n"
+    "sys.stdout.flush()\n"
+    "sys.exit(rc)\n"
+)
+
+
+class StdinRun(NamedTuple):
+    proc: subprocess.CompletedProcess
+    files: Dict[str, str]            # collected files that existed afterwards
+    usage: Optional[Dict[str, Any]]  # cpu_user_s, cpu_sys_s, peak_rss_kb, wall_s, oom_killed
+
+
+def tar_members(files: Dict[str, str]) -> bytes:
+    """Tar headers + data for `files`, without the end-of-archive blocks, so pieces can be concatenated."""
+    out = []
+    now = int(time.time())
+    for name, content in files.items():
+        data = (content or "").encode("utf-8")
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = now
+        out.append(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        out.append(data)
+        out.append(b"\0" * (-len(data) % tarfile.BLOCKSIZE))
+    return b"".join(out)
+
+
+class FileBundle(NamedTuple):
+    """A file map that is shipped unchanged many times (e.g. a homework's tests), packed once."""
+    files: Dict[str, str]
+    tar: bytes
+    digest: str
+
+
+def make_bundle(files: Dict[str, str]) -> FileBundle:
+    h = hashlib.sha256()
+    for name in sorted(files):
+        data = (files[name] or "").encode("utf-8")
+        h.update(b"\0F" + name.encode("utf-8") + b"\0" + str(len(data)).encode() + b"\0")
+        h.update(data)
+    return FileBundle(dict(files), tar_members(files), h.hexdigest())
+
+
+def workspace_tar(files: Dict[str, str], bundle: Optional[FileBundle] = None) -> bytes:
+    # bundle members come last, so they win over same-named workspace files
+    return tar_members(files) + (bundle.tar if bundle else b"") + b"\0" * (2 * tarfile.BLOCKSIZE)
+
+
+def stdin_exec_cmd(inner_cmd: List[str], collect=(), usage: bool = False) -> List[str]:
+    """Container-side argv: unpack stdin into the cwd, then run inner_cmd."""
+    opts = {"collect": list(collect), "usage": usage}
+    return ["python", "-c", STDIN_EXEC_PY, json.dumps(opts), *inner_cmd]
+
+
+def _text(b) -> str:
+    if b is None:
+        return ""
+    return b.decode("utf-8", errors="replace") if isinstance(b, bytes) else b
+
+
+def run_with_stdin_workspace(docker_argv: List[str], files: Dict[str, str], inner_cmd: List[str],
+                             timeout_s: float, collect=(), bundle: Optional[FileBundle] = None) -> StdinRun:
+    """
+    docker_argv is everything up to and including the image / container name
+    (`docker run --rm -i ... image` or `docker exec -i ... name`); `bundle`,
+    if given, is unpacked over `files`.  Returns a StdinRun (text output,
+    collected files, resource usage) and raises TimeoutExpired like
+    subprocess.run, with text stdout/stderr.
+    """
+    try:
+        p = subprocess.run([*docker_argv, *stdin_exec_cmd(inner_cmd, collect, usage=True)],
+                           input=workspace_tar(files, bundle), capture_output=True, timeout=timeout_s)
+    except subprocess.TimeoutExpired as e:
+        e.stdout, e.stderr = _text(e.stdout), _text(e.stderr)
+        raise
+
+    stdout, trailer = _text(p.stdout), {}
+    head, sep, tail = stdout.rpartition("\n" + COLLECT_MARKER)
+    if sep:
+        stdout = head
+        try:
+            trailer = json.loads(tail)
+        except ValueError:
+            trailer = {}
+    return StdinRun(subprocess.CompletedProcess(p.args, p.returncode, stdout, _text(p.stderr)),
+                    trailer.get("files") or {}, trailer.get("usage"))
+
+
+def popen_with_stdin_workspace(docker_argv: List[str], files: Dict[str, str], inner_cmd: List[str],
+                               bundle: Optional[FileBundle] = None) -> subprocess.Popen:
+    """Like run_with_stdin_workspace, but returns the running process (binary pipes) for streaming."""
+    p = subprocess.Popen([*docker_argv, *stdin_exec_cmd(inner_cmd)],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        p.stdin.write(workspace_tar(files, bundle))
+    except BrokenPipeError:
+        pass   # docker exited early; its stderr says why
+    finally:
+        p.stdin.close()
+    return p
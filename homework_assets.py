@@ -0,0 +1,117 @@
+# homework_assets.py
+"""
+In-process cache of each homework's files on disk: prompt.md, the starter
+workspace and the test bundles (public only / public + hidden, optionally
+narrowed to one question), already packed for the grader.
+
+Entries are keyed by slug and revalidated at most every HW_ASSET_CHECK_S
+against a signature of the directory's mtimes and sizes, so editing a test
+or prompt on the server is picked up without a restart.
+"""
+import hashlib, os, re, threading, time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from grader_workspace import FileBundle, make_bundle
+from homework_defs import HOMEWORKS
+
+
+HW_ASSET_CHECK_S = float(os.environ.get("HW_ASSET_CHECK_S", "2"))
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def _read_dir(d: Path, pattern: str) -> Dict[str, str]:
+    if not d.is_dir():
+        return {}
+    return {p.name: p.read_text(encoding="utf-8") for p in sorted(d.glob(pattern)) if p.is_file()}
+
+
+def _signature(root: Path) -> str:
+    entries = []
+    for d, pattern in ((root, "prompt.md"), (root, "starter.py"), (root / "starter_files", "**/*"),
+                       (root / "tests_public", "*.py"), (root / "tests_hidden", "*.py")):
+        if not d.is_dir():
+            continue
+        entries.append((str(d), d.stat().st_mtime_ns))   # catches added / removed files
+        for p in sorted(d.glob(pattern)):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((str(p), st.st_mtime_ns, st.st_size))
+    return hashlib.sha1(repr(entries).encode()).hexdigest()
+
+
+class HomeworkAssets:
+    def __init__(self, slug: str, root: Path, signature: str):
+        self.slug = slug
+        self.root = root
+        self.signature = signature
+        self.checked_at = time.monotonic()
+
+        prompt = root / "prompt.md"
+        self.prompt_md = prompt.read_text(encoding="utf-8") if prompt.exists() else ""
+
+        starter: Dict[str, str] = {}
+        starter_dir = root / "starter_files"
+        if starter_dir.is_dir():
+            for p in sorted(starter_dir.rglob("*")):
+                if p.is_file():
+                    starter[p.relative_to(starter_dir).as_posix()] = p.read_text(encoding="utf-8")
+        if not starter:
+            starter_py = root / "starter.py"
+            starter = {"student.py": starter_py.read_text(encoding="utf-8") if starter_py.exists() else ""}
+        self._starter = starter
+
+        self.tests_public = _read_dir(root / "tests_public", "*.py")
+        self.tests_hidden = _read_dir(root / "tests_hidden", "*.py")
+
+        self._bundles: Dict[Tuple[bool, Optional[int]], FileBundle] = {}
+        self._lock = threading.Lock()
+
+    def starter_workspace(self) -> Dict[str, str]:
+        return dict(self._starter)   # callers overlay the student's files on it
+
+    def tests(self, include_hidden: bool, qid: Optional[int] = None) -> FileBundle:
+        """Test files for one run, packed once per (include_hidden, qid).  Unknown qid -> FileNotFoundError."""
+        k = (bool(include_hidden), qid)
+        bundle = self._bundles.get(k)
+        if bundle is not None:
+            return bundle
+
+        if qid is None:
+            files = dict(self.tests_public)
+        else:
+            names = ([n for n in self.tests_public if re.fullmatch(rf"test_q{qid}_.*\.py", n)]
+                     or [n for n in self.tests_public if n == f"test_q{qid}.py"])
+            if not names:
+                raise FileNotFoundError(f"no public test for qid={qid}")
+            files = {n: self.tests_public[n] for n in names}
+        if include_hidden:
+            files.update(self.tests_hidden)
+
+        with self._lock:
+            return self._bundles.setdefault(k, make_bundle(files))
+
+
+_cache: Dict[str, HomeworkAssets] = {}
+_cache_lock = threading.Lock()
+
+
+def get(slug: str) -> HomeworkAssets:
+    """Assets for a slug in HOMEWORKS (KeyError otherwise), reloaded when the files change."""
+    root = (BASE_DIR / HOMEWORKS[slug]["root"]).resolve()
+    cur = _cache.get(slug)
+    if cur is not None and time.monotonic() - cur.checked_at < HW_ASSET_CHECK_S:
+        return cur
+
+    sig = _signature(root)
+    if cur is not None and cur.signature == sig:
+        cur.checked_at = time.monotonic()
+        return cur
+
+    fresh = HomeworkAssets(slug, root, sig)
+    with _cache_lock:
+        _cache[slug] = fresh
+    return fresh
@@ -1,5 +1,6 @@
 # models_homework.py
 from datetime import datetime
+from sqlalchemy import inspect, text
 from extensions import db
 
 class HomeworkSubmission(db.Model):
@@ -12,6 +13,7 @@ class HomeworkSubmission(db.Model):
     section = db.Column(db.Integer, nullable=True, index=True)
     code = db.Column(db.Text, nullable=False)                     # student.py contents
     result_json = db.Column(db.Text, nullable=False)              # json string of grader result
+    report_json = db.Column(db.Text, nullable=True)               # compact per-test report (docker_grader.parse_junit_report)
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     is_final = db.Column(db.Integer, nullable=False, default=0)
@@ -32,3 +34,20 @@ class HomeworkSubmission(db.Model):
     reopen_penalty_frac = db.Column(db.Float, nullable=False, default=0.0)
     score_final_after_reopen = db.Column(db.Float, nullable=True)
     diff_base_code = db.Column(db.Text, nullable=True)
+
+
+# Columns added after homework_submissions first shipped; create_all() won't add them
+_ADDED_COLUMNS = {
+    "report_json": "TEXT",
+}
+
+
+def ensure_homework_columns():
+    insp = inspect(db.engine)
+    if not insp.has_table(HomeworkSubmission.__tablename__):
+        return
+    have = {c["name"] for c in insp.get_columns(HomeworkSubmission.__tablename__)}
+    for name, ddl in _ADDED_COLUMNS.items():
+        if name not in have:
+            with db.engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {HomeworkSubmission.__tablename__} ADD COLUMN {name} {ddl}"))
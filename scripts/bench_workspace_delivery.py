@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare the two ways of getting a workspace into a grader container:
+
+  bind   mkdtemp + write + chmod + `docker run -v tmp:/work` + rmtree (the old path)
+  stdin  in-memory tar piped to `docker run -i` and unpacked into a /work tmpfs
+
+    python scripts/bench_workspace_delivery.py --runs 30 --files 8 --kb 4
+    python scripts/bench_workspace_delivery.py --host-only   # no docker: host-side cost only
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from grader_workspace import WORKDIR, WORK_TMPFS, run_with_stdin_workspace, workspace_tar
+
+INNER_CMD = ["python", "-c", "import os; print(len(os.listdir('.')))"]
+
+
+def make_files(n: int, kb: int) -> dict[str, str]:
+    body = ("x = 1  # padding\n" * (kb * 64))[: kb * 1024]
+    files = {f"mod_{i}.py": body for i in range(n - 1)}
+    files["main.py"] = "print('ok')\n"
+    return files
+
+
+def bind_host(files):
+    tmp = Path(tempfile.mkdtemp(prefix="bench_ws_"))
+    try:
+        os.chmod(tmp, 0o755)
+        for name, content in files.items():
+            p = tmp / name
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_text(content, encoding="utf-8")
+            os.chmod(p, 0o644)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def stdin_host(files):
+    workspace_tar(files)
+
+
+def bind_docker(files):
+    from docker_grader import DOCKER_BIN, GRADER_IMAGE, SANDBOX_FLAGS
+    tmp = Path(tempfile.mkdtemp(prefix="bench_ws_"))
+    try:
+        os.chmod(tmp, 0o755)
+        for name, content in files.items():
+            p = tmp / name
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_text(content, encoding="utf-8")
+            os.chmod(p, 0o644)
+        subprocess.run([DOCKER_BIN, "run", "--rm", *SANDBOX_FLAGS, "-v", f"{tmp}:/work:ro", "-w", "/work",
+                        GRADER_IMAGE, *INNER_CMD], capture_output=True, text=True, timeout=60, check=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def stdin_docker(files):
+    from docker_grader import DOCKER_BIN, GRADER_IMAGE, SANDBOX_FLAGS
+    p, _ = run_with_stdin_workspace([DOCKER_BIN, "run", "--rm", "-i", *SANDBOX_FLAGS, *WORK_TMPFS,
+                                     "-w", WORKDIR, GRADER_IMAGE], files, INNER_CMD, 60)
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr)
+
+
+def bench(name, fn, files, runs):
+    fn(files)  # warm-up
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn(files)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    print(f"{name:6s}  mean {statistics.mean(times):8.2f} ms   p50 {times[len(times) // 2]:8.2f} ms   "
+          f"p95 {times[min(len(times) - 1, int(0.95 * len(times)))]:8.2f} ms")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--files", type=int, default=6, help="files per workspace")
+    ap.add_argument("--kb", type=int, default=4, help="size of each file")
+    ap.add_argument("--host-only", action="store_true", help="skip docker, time only the host-side work")
+    args = ap.parse_args()
+
+    files = make_files(args.files, args.kb)
+    print(f"{args.runs} runs, {len(files)} files x {args.kb} KB" + ("  (host side only)" if args.host_only else ""))
+    if args.host_only:
+        bench("bind", bind_host, files, args.runs)
+        bench("stdin", stdin_host, files, args.runs)
+    else:
+        bench("bind", bind_docker, files, args.runs)
+        bench("stdin", stdin_docker, files, args.runs)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+// Waits for a queued grading job (HTTP 202 {job_id, status_url}) to finish.
+// Resolves with the same JSON the endpoint would have returned inline.
+(function(){
+  let socket = null;
+  const waiters = new Map();
+
+  function ensureSocket(){
+    if (socket || typeof io === "undefined") return;
+    socket = io({ withCredentials: true });
+    socket.on("grader_job_done", (job)=>{
+      const w = job && waiters.get(job.job_id);
+      if (w) w(job);
+    });
+  }
+
+  function settle(job){
+    if (job.status === "failed") throw new Error(job.error || "Grading failed.");
+    const status = job.http_status || 200;
+    if (status >= 400) throw new Error(`HTTP ${status}: ${JSON.stringify(job.result || {})}`);
+    return job.result || {};
+  }
+
+  window.awaitGraderJob = function(queued, timeoutMs=120000){
+    ensureSocket();
+    const deadline = Date.now() + timeoutMs;
+
+    return new Promise((resolve, reject)=>{
+      let done = false;
+      let timer = null;
+
+      function finish(job){
+        if (done) return;
+        done = true;
+        waiters.delete(queued.job_id);
+        clearTimeout(timer);
+        try { resolve(settle(job)); } catch(e){ reject(e); }
+      }
+
+      async function poll(){
+        if (done) return;
+        if (Date.now() > deadline){
+          done = true;
+          waiters.delete(queued.job_id);
+          reject(new Error("Grading is taking longer than expected; try again shortly."));
+          return;
+        }
+        try{
+          const r = await fetch(queued.status_url, { credentials: "same-origin" });
+          const job = await r.json();
+          if (job.status === "done" || job.status === "failed") return finish(job);
+        } catch(e){ /* keep polling */ }
+        timer = setTimeout(poll, 1500);
+      }
+
+      waiters.set(queued.job_id, finish);
+      poll();
+    });
+  };
+})();
@@ -0,0 +1,64 @@
+// Live output for Run buttons: POSTs {...body, stream: true, run_id} and
+// feeds `run_output` socket frames to onOutput(stream, text) until `run_done`.
+// Resolves with the run_done frame, or with the plain JSON reply if the
+// server answered without streaming.  Returns null when no socket is
+// available so the caller can fall back to a buffered request.
+(function(){
+  let socket = null;
+  const runs = new Map();
+
+  function ensureSocket(){
+    if (socket || typeof io === "undefined") return socket;
+    socket = io({ withCredentials: true });
+    socket.on("run_output", (f)=>{
+      const r = f && runs.get(f.run_id);
+      if (r) r.onOutput(f.stream, f.data);
+    });
+    socket.on("run_done", (f)=>{
+      const r = f && runs.get(f.run_id);
+      if (r) r.done(f);
+    });
+    return socket;
+  }
+
+  function connected(s, ms){
+    if (s.connected) return Promise.resolve(true);
+    return new Promise((resolve)=>{
+      const t = setTimeout(()=>resolve(false), ms);
+      s.once("connect", ()=>{ clearTimeout(t); resolve(true); });
+    });
+  }
+
+  function newRunId(){
+    const a = new Uint8Array(16);
+    crypto.getRandomValues(a);
+    return Array.from(a, b => b.toString(16).padStart(2, "0")).join("");
+  }
+
+  window.streamRun = async function(url, body, onOutput, timeoutMs=30000){
+    const s = ensureSocket();
+    if (!s || !(await connected(s, 2000))) return null;
+
+    const runId = newRunId();
+    let finish;
+    const finished = new Promise((resolve)=>{ finish = resolve; });
+    runs.set(runId, { onOutput, done: finish });
+    const timer = setTimeout(()=>finish({ run_id: runId, error: "no_response" }), timeoutMs);
+
+    try{
+      const r = await fetch(url, {
+        method: "POST",
+        credentials: "same-origin",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ...body, stream: true, run_id: runId })
+      });
+      const j = await r.json().catch(()=>({}));
+      if (r.status !== 202 || !j.stream) return j;
+      const frame = await finished;
+      return { cmd_display: j.cmd_display, ...frame };
+    } finally {
+      clearTimeout(timer);
+      runs.delete(runId);
+    }
+  };
+})();